@@ -0,0 +1,321 @@
+"""
+Memory-mapped KNN model artifact.
+
+Replaces unpickling ``knn_model.pkl`` + ``scaler.pkl`` in every process. The
+artifact is a single file laid out as::
+
+    magic (8 bytes) | format version (uint32) | header length (uint32)
+    JSON header, padded to a 64-byte boundary
+    raw little-endian arrays, each starting on a 64-byte boundary
+
+The header carries the schema name, feature names, KNN hyperparameters,
+classes, a model version counter and the dtype/shape/offset of every array.
+``open_artifact`` maps the arrays read-only with ``np.memmap``: nothing is
+copied at startup, and every process serving the same file shares the same
+page-cache pages.
+
+Export the current pickles with ``python artifacts.py export``, and check that
+the NumPy-only runtime reproduces them with ``python artifacts.py verify``.
+
+The apps, service.py and parallel_scoring.py open the artifact with
+``index=serving_index()``: set ``HEART_INDEX`` to one of the
+``neighbor_index.INDEX_KINDS`` (e.g. ``HEART_INDEX=categorical``) to serve
+neighbor queries from that index instead of the fused brute-force search.
+"""
+import argparse
+import json
+import os
+import struct
+import tempfile
+import uuid
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+
+from predictor import KNNPredictor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_PATH = os.path.join(BASE_DIR, "knn_model.mmap")
+# Environment variable naming the neighbor index the serving processes build.
+INDEX_ENV = "HEART_INDEX"
+
+MAGIC = b"KNNMMAP\0"
+FORMAT_VERSION = 1
+SCHEMA = "heart-disease-knn"
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")
+
+# name -> (dtype, number of dimensions)
+ARRAY_SCHEMA = {
+    "train_scaled": ("<f8", 2),
+    "train_y": ("<i8", 1),
+    "classes": ("<i8", 1),
+    "mean": ("<f8", 1),
+    "scale": ("<f8", 1),
+    # Folded-scaler bias of KNNPredictor, stored so a cold start never has to
+    # touch the whole training matrix.
+    "bias": ("<f8", 1),
+}
+
+
+class ArtifactError(ValueError):
+    """
+    Raised when an artifact file is malformed or has an unsupported version/schema.
+    """
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_artifact(path, predictor, model_version=1, metadata=None):
+    """
+    Write ``predictor`` to ``path`` atomically (temporary file + ``os.replace``).
+
+    Readers that already mapped the previous file keep a consistent view of it.
+    """
+    n_train = predictor.train_scaled.shape[0]
+    arrays = {
+        "train_scaled": predictor.train_scaled,
+        "train_y": predictor.train_y,
+        "classes": predictor.classes,
+        "mean": predictor.mean,
+        "scale": predictor.scale,
+        # Only the Euclidean path uses the folded bias.
+        "bias": predictor._bias if predictor._bias is not None else np.zeros(n_train),
+    }
+    arrays = {
+        name: np.ascontiguousarray(arrays[name], dtype=dtype)
+        for name, (dtype, _) in ARRAY_SCHEMA.items()
+    }
+
+    header = {
+        "schema": SCHEMA,
+        "format_version": FORMAT_VERSION,
+        "model_version": int(model_version),
+        # Unique per write, so caches can tell two exports apart.
+        "artifact_id": uuid.uuid4().hex,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "feature_names": list(predictor.feature_names),
+        "n_neighbors": predictor.n_neighbors,
+        "weights": predictor.weights,
+        "p": predictor.p,
+        "metadata": metadata or {},
+        "arrays": {},
+    }
+    # Array offsets depend on the header length, so grow the reserved header
+    # size until the encoded header fits in it.
+    header_len = 0
+    while True:
+        offset = _align(_PREAMBLE.size + header_len)
+        for name, array in arrays.items():
+            header["arrays"][name] = {
+                "dtype": ARRAY_SCHEMA[name][0],
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset = _align(offset + array.nbytes)
+        encoded = json.dumps(header, sort_keys=True).encode("utf-8")
+        if len(encoded) <= header_len:
+            break
+        header_len = _align(len(encoded) + ALIGNMENT)
+    encoded = encoded.ljust(header_len, b" ")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".mmap")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_len))
+            f.write(encoded)
+            for name, array in arrays.items():
+                f.seek(header["arrays"][name]["offset"])
+                f.write(array.tobytes())
+            f.truncate(_align(f.tell()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return header
+
+
+def export_sklearn(knn_model, scaler, path=ARTIFACT_PATH, model_version=1, metadata=None):
+    """
+    Export a fitted ``KNeighborsClassifier`` + ``StandardScaler`` pair.
+    """
+    predictor = KNNPredictor.from_sklearn(knn_model, scaler)
+    return write_artifact(path, predictor, model_version=model_version, metadata=metadata)
+
+
+def artifact_stamp(path=ARTIFACT_PATH):
+    """
+    Cheap identity of the artifact file currently at ``path``.
+
+    Changes whenever a new version is published with ``write_artifact`` (which
+    swaps in a new inode), so callers can key caches on it and reload.
+    """
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def read_header(path):
+    """
+    Read and validate the artifact header without mapping any arrays.
+    """
+    with open(path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) != _PREAMBLE.size:
+            raise ArtifactError(f"{path} is too short to be a model artifact")
+        magic, version, header_len = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ArtifactError(f"{path} is not a KNN model artifact")
+        if version != FORMAT_VERSION:
+            raise ArtifactError(
+                f"{path} uses artifact format v{version}; this code reads v{FORMAT_VERSION}"
+            )
+        try:
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        except ValueError as e:
+            raise ArtifactError(f"{path} has a corrupt header: {e}") from None
+        file_size = os.fstat(f.fileno()).st_size
+
+    if header.get("schema") != SCHEMA:
+        raise ArtifactError(f"{path} has schema {header.get('schema')!r}, expected {SCHEMA!r}")
+    specs = header.get("arrays", {})
+    missing = [name for name in ARRAY_SCHEMA if name not in specs]
+    if missing:
+        raise ArtifactError(f"{path} is missing arrays: {missing}")
+    for name, (dtype, ndim) in ARRAY_SCHEMA.items():
+        spec = specs[name]
+        if spec["dtype"] != dtype or len(spec["shape"]) != ndim:
+            raise ArtifactError(f"{path}: array {name!r} has unexpected dtype/shape {spec}")
+        nbytes = int(np.prod(spec["shape"])) * np.dtype(dtype).itemsize
+        if spec["offset"] + nbytes > file_size:
+            raise ArtifactError(f"{path}: array {name!r} runs past the end of the file")
+
+    n_train, n_features = specs["train_scaled"]["shape"]
+    if (specs["train_y"]["shape"] != [n_train] or specs["bias"]["shape"] != [n_train]
+            or specs["mean"]["shape"] != [n_features] or specs["scale"]["shape"] != [n_features]
+            or len(header["feature_names"]) != n_features):
+        raise ArtifactError(f"{path}: array shapes are inconsistent")
+    return header
+
+
+def serving_index(environ=os.environ):
+    """
+    Neighbor index kind the serving processes use: ``HEART_INDEX``, default ``brute``.
+    """
+    return environ.get(INDEX_ENV) or "brute"
+
+
+def open_artifact(path=ARTIFACT_PATH, index=None):
+    """
+    Map an artifact read-only and return a ``KNNPredictor`` over it.
+
+    The header is available as ``predictor.artifact`` and the file as
+    ``predictor.artifact_path``. ``index`` names a ``neighbor_index`` kind to
+    build over the mapped training matrix (``predictor.use_index``); ``None``
+    keeps the fused brute-force search.
+    """
+    header = read_header(path)
+    # One read-only mapping of the whole file; arrays are zero-copy views into it.
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {
+        name: np.ndarray(tuple(spec["shape"]), dtype=spec["dtype"],
+                         buffer=mapped, offset=spec["offset"])
+        for name, spec in header["arrays"].items()
+    }
+    predictor = KNNPredictor(
+        arrays["train_scaled"], arrays["train_y"], arrays["classes"],
+        arrays["mean"], arrays["scale"],
+        n_neighbors=header["n_neighbors"], weights=header["weights"], p=header["p"],
+        feature_names=header["feature_names"], bias=arrays["bias"],
+    )
+    predictor.artifact = header
+    predictor.artifact_path = os.path.abspath(path)
+    if index is not None:
+        predictor.use_index(index)
+    return predictor
+
+
+def verify_sklearn(predictor, knn_model, scaler, X):
+    """
+    Compare ``predictor`` against the fitted sklearn pair on raw rows ``X``.
+
+    Returns a dict of mismatch counts. Scaled rows, labels and probabilities
+    must agree exactly; distances may differ in the last bits because sklearn
+    computes them through the expanded ``||a||^2 - 2ab + ||b||^2`` form.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    scaled = scaler.transform(X)
+    result = predictor.predict(X)
+    ref_distances, ref_indices = knn_model.kneighbors(scaled)
+
+    # Equidistant neighbors may come back in a different order; compare sets.
+    same_neighbors = (np.sort(result.indices, axis=1) == np.sort(ref_indices, axis=1)).all(axis=1)
+    return {
+        "rows": int(X.shape[0]),
+        "transform": int((predictor.transform(X) != scaled).any(axis=1).sum()),
+        "neighbors": int((~same_neighbors).sum()),
+        "distances": int((~np.isclose(result.distances, ref_distances, rtol=1e-9, atol=1e-9)).any(axis=1).sum()),
+        "labels": int((result.labels != knn_model.predict(scaled)).sum()),
+        "proba": int((result.proba != knn_model.predict_proba(scaled)).any(axis=1).sum()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or inspect the memory-mapped KNN artifact.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="convert knn_model.pkl + scaler.pkl")
+    export.add_argument("--model", default=os.path.join(BASE_DIR, "knn_model.pkl"))
+    export.add_argument("--scaler", default=os.path.join(BASE_DIR, "scaler.pkl"))
+    export.add_argument("--out", default=ARTIFACT_PATH)
+    export.add_argument("--model-version", type=int, default=1)
+
+    info = commands.add_parser("info", help="print and validate an artifact header")
+    info.add_argument("path", nargs="?", default=ARTIFACT_PATH)
+
+    verify = commands.add_parser("verify", help="check an artifact against the pickles")
+    verify.add_argument("path", nargs="?", default=ARTIFACT_PATH)
+    verify.add_argument("--model", default=os.path.join(BASE_DIR, "knn_model.pkl"))
+    verify.add_argument("--scaler", default=os.path.join(BASE_DIR, "scaler.pkl"))
+    verify.add_argument("--synthetic-rows", type=int, default=10_000)
+    verify.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        import joblib
+
+        header = export_sklearn(joblib.load(args.model), joblib.load(args.scaler),
+                                args.out, model_version=args.model_version)
+        print(f"Wrote {args.out} ({header['arrays']['train_scaled']['shape'][0]} reference rows)")
+    elif args.command == "verify":
+        import joblib
+
+        from synthetic import load_dataset, synthetic_rows
+
+        # Pickles written by another scikit-learn version warn on every load.
+        warnings.filterwarnings("ignore", module="sklearn")
+        predictor = open_artifact(args.path)
+        knn_model, scaler = joblib.load(args.model), joblib.load(args.scaler)
+        source = load_dataset()
+        X = np.vstack([
+            source[predictor.feature_names].to_numpy(dtype=np.float64),
+            synthetic_rows(args.synthetic_rows, source=source, seed=args.seed)[
+                predictor.feature_names].to_numpy(dtype=np.float64),
+        ])
+        report = verify_sklearn(predictor, knn_model, scaler, X)
+        print(json.dumps(report, indent=2))
+        if any(report[name] for name in ("transform", "neighbors", "labels", "proba")):
+            raise SystemExit(f"{args.path} does not reproduce {args.model}")
+    else:
+        print(json.dumps(read_header(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
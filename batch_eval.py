@@ -0,0 +1,96 @@
+"""
+Incremental evaluation helpers for the batch tester.
+
+``StreamingEvaluator`` keeps only a confusion matrix, so accuracy and the
+classification report can be refreshed after every chunk of a CSV that is far
+too large to hold in memory at once.
+"""
+import numpy as np
+import pandas as pd
+
+
+def iter_csv_chunks(source, chunksize, dtype=None):
+    """
+    Yield DataFrames of at most ``chunksize`` rows from a CSV path or file object.
+    """
+    with pd.read_csv(source, chunksize=chunksize, dtype=dtype) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+class StreamingEvaluator:
+    """
+    Accumulate a confusion matrix chunk by chunk.
+
+    ``labels`` fixes the row/column order of the matrix (the model's classes),
+    so chunks that happen to contain a single class still line up.
+    """
+
+    def __init__(self, labels=(0, 1)):
+        self.labels = np.asarray(labels)
+        self.confusion_matrix = np.zeros((len(self.labels), len(self.labels)), dtype=np.int64)
+
+    @property
+    def n_rows(self):
+        return int(self.confusion_matrix.sum())
+
+    @property
+    def accuracy(self):
+        total = self.n_rows
+        return float(np.trace(self.confusion_matrix)) / total if total else 0.0
+
+    def update(self, y_true, y_pred):
+        """
+        Add one chunk of true and predicted labels to the running totals.
+        """
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        true_idx = np.searchsorted(self.labels, y_true)
+        pred_idx = np.searchsorted(self.labels, y_pred)
+        n_labels = len(self.labels)
+        for name, values, idx in (("target", y_true, true_idx), ("prediction", y_pred, pred_idx)):
+            known = (idx < n_labels) & (self.labels[np.minimum(idx, n_labels - 1)] == values)
+            if not known.all():
+                unknown = np.unique(values[~known])
+                raise ValueError(f"Unexpected {name} values {unknown.tolist()}; expected {self.labels.tolist()}")
+        flat = true_idx * n_labels + pred_idx
+        self.confusion_matrix += np.bincount(flat, minlength=n_labels * n_labels).reshape(n_labels, n_labels)
+
+    def classification_report(self, digits=2):
+        """
+        Text report laid out like ``sklearn.metrics.classification_report(zero_division=0)``.
+        """
+        cm = self.confusion_matrix.astype(np.float64)
+        support = cm.sum(axis=1)
+        predicted = cm.sum(axis=0)
+        tp = np.diag(cm)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(predicted > 0, tp / predicted, 0.0)
+            recall = np.where(support > 0, tp / support, 0.0)
+            denom = precision + recall
+            f1 = np.where(denom > 0, 2 * precision * recall / denom, 0.0)
+        total = support.sum()
+
+        headers = ["precision", "recall", "f1-score", "support"]
+        target_names = [str(label) for label in self.labels]
+        width = max(max(len(name) for name in target_names), len("weighted avg"), digits)
+        head_fmt = "{:>{width}s} " + " {:>9}" * len(headers)
+        row_fmt = "{:>{width}s} " + " {:>9.{digits}f}" * 3 + " {:>9}\n"
+
+        report = head_fmt.format("", *headers, width=width) + "\n\n"
+        for name, p, r, f, s in zip(target_names, precision, recall, f1, support):
+            report += row_fmt.format(name, p, r, f, int(s), width=width, digits=digits)
+        report += "\n"
+
+        accuracy_fmt = "{:>{width}s} " + " {:>9.{digits}}" * 2 + " {:>9.{digits}f}" + " {:>9}\n"
+        report += accuracy_fmt.format("accuracy", "", "", self.accuracy, int(total), width=width, digits=digits)
+        report += row_fmt.format(
+            "macro avg", precision.mean(), recall.mean(), f1.mean(), int(total),
+            width=width, digits=digits
+        )
+        weights = support / total if total else np.zeros_like(support)
+        report += row_fmt.format(
+            "weighted avg", precision @ weights, recall @ weights, f1 @ weights, int(total),
+            width=width, digits=digits
+        )
+        return report
@@ -0,0 +1,333 @@
+"""
+Benchmark suite for the loading, inference and batch-evaluation paths.
+
+Suites:
+
+- ``load``: ``joblib.load`` of ``knn_model.pkl``/``scaler.pkl`` vs. opening the
+  memory-mapped ``knn_model.mmap``.
+- ``startup``: wall time and peak RSS of a fresh interpreter that loads a model
+  and answers one row, through pandas + scikit-learn vs. the NumPy-only
+  runtime the apps import.
+- ``single``: single-row latency (p50/p99) of the original
+  DataFrame -> ``scaler.transform`` -> ``predict`` -> ``predict_proba`` path
+  used by dui.py, the fused predictor, and a warm prediction cache.
+- ``batch``: rows/second over batch sizes for the ui_heart-disease.py flow.
+- ``scaling``: how the fused predictor scales with reference-set size, using
+  synthetic rows drawn from the Cleveland CSV's distributions.
+- ``parallel``: multi-process batch scoring (``parallel_scoring.py``) over
+  worker counts, against a synthetic reference set shared through an mmap.
+
+Results are written as JSON; pass ``--baseline old.json`` to print the ratio of
+every timing against an earlier run (e.g. a previous model version)::
+
+    python benchmark.py --output bench-v2.json --baseline bench-v1.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ARTIFACT_PATH, open_artifact
+from parallel_scoring import ParallelScorer
+from prediction_cache import CachedPredictor, PredictionCache
+from predictor import FEATURE_NAMES, KNNPredictor
+from synthetic import load_dataset, synthetic_rows
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "knn_model.pkl")
+SCALER_PATH = os.path.join(BASE_DIR, "scaler.pkl")
+
+SUITES = ["load", "startup", "single", "batch", "scaling", "parallel"]
+
+
+def time_calls(fn, repeat):
+    """
+    Call ``fn`` ``repeat`` times and return the wall time of each call in seconds.
+    """
+    timings = np.empty(repeat, dtype=np.float64)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def summarize_ms(timings):
+    ms = np.asarray(timings) * 1e3
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "n": int(ms.size),
+    }
+
+
+def load_sklearn():
+    import joblib
+
+    return joblib.load(MODEL_PATH), joblib.load(SCALER_PATH)
+
+
+def bench_load(args):
+    import joblib
+
+    return {
+        "joblib_pickles": summarize_ms(time_calls(
+            lambda: (joblib.load(MODEL_PATH), joblib.load(SCALER_PATH)), args.load_repeat)),
+        "mmap_artifact": summarize_ms(time_calls(
+            lambda: open_artifact(args.artifact), args.load_repeat)),
+    }
+
+
+# Each snippet runs in a fresh interpreter and prints its peak RSS in KiB and
+# which heavy packages ended up imported. The peak is VmHWM of the child's own
+# address space: Linux keeps ru_maxrss across execve, so that would report the
+# (larger) peak of this benchmark process for every snippet. ru_maxrss is the
+# fallback where /proc is unavailable (KiB on Linux, bytes on macOS).
+_STARTUP_REPORT = (
+    "import resource, sys\n"
+    "try:\n"
+    "    peak = next(int(l.split()[1]) for l in open('/proc/self/status') if l.startswith('VmHWM:'))\n"
+    "except (OSError, StopIteration):\n"
+    "    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+    "print(peak, sorted(m for m in ('pandas', 'sklearn', 'scipy', 'joblib') if m in sys.modules))"
+)
+STARTUP_SNIPPETS = {
+    "sklearn_pickles": (
+        "import joblib, pandas as pd\n"
+        "from predictor import FEATURE_NAMES\n"
+        "knn_model, scaler = joblib.load({model!r}), joblib.load({scaler!r})\n"
+        "X = scaler.transform(pd.DataFrame([[60, 1, 0, 140, 240, 0, 1, 150, 0, 1.0, 1, 0, 2]], columns=FEATURE_NAMES))\n"
+        "knn_model.predict(X); knn_model.predict_proba(X)\n"
+    ),
+    "numpy_runtime": (
+        "from artifacts import open_artifact\n"
+        "open_artifact({artifact!r}).predict_one([60, 1, 0, 140, 240, 0, 1, 150, 0, 1.0, 1, 0, 2])\n"
+    ),
+}
+
+
+def bench_startup(args):
+    results = {}
+    for name, snippet in STARTUP_SNIPPETS.items():
+        code = snippet.format(model=MODEL_PATH, scaler=SCALER_PATH, artifact=args.artifact) + _STARTUP_REPORT
+        timings = []
+        for _ in range(args.startup_repeat):
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], cwd=BASE_DIR,
+                                 check=True, capture_output=True, text=True).stdout
+            timings.append(time.perf_counter() - start)
+        max_rss_kib, modules = out.strip().splitlines()[-1].split(" ", 1)
+        results[name] = {
+            **summarize_ms(timings),
+            "max_rss_mib": int(max_rss_kib) / 1024,
+            "heavy_modules": json.loads(modules.replace("'", '"')),
+        }
+    # The two paths load very different libraries; equal peaks mean the
+    # measurement came from somewhere other than the child's own memory.
+    peaks = [r["max_rss_mib"] for r in results.values()]
+    if len(peaks) > 1 and len(set(peaks)) == 1:
+        print(f"warning: every startup path reports the same peak RSS ({peaks[0]:.2f} MiB); "
+              "it is not the child's own", file=sys.stderr)
+    return results
+
+
+def bench_single(args):
+    knn_model, scaler = load_sklearn()
+    predictor = open_artifact(args.artifact)
+    rows = load_dataset()[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(args.seed)
+    picks = rows[rng.integers(0, len(rows), size=args.repeat)]
+    it = iter(range(args.repeat))
+
+    def sklearn_path():
+        row = picks[next(it)]
+        input_df = pd.DataFrame([row], columns=FEATURE_NAMES)
+        input_scaled = scaler.transform(input_df)
+        knn_model.predict(input_scaled)
+        knn_model.predict_proba(input_scaled)
+
+    results = {"sklearn_dataframe": summarize_ms(time_calls(sklearn_path, args.repeat))}
+
+    it = iter(range(args.repeat))
+    results["fused_predictor"] = summarize_ms(time_calls(
+        lambda: predictor.predict_one(picks[next(it)]), args.repeat))
+
+    cached = CachedPredictor(predictor, PredictionCache(maxsize=len(rows)))
+    for row in rows:
+        cached.predict_one(row)
+    it = iter(range(args.repeat))
+    results["cached_predictor_hit"] = summarize_ms(time_calls(
+        lambda: cached.predict_one(picks[next(it)]), args.repeat))
+    return results
+
+
+def bench_batch(args):
+    knn_model, scaler = load_sklearn()
+    predictor = open_artifact(args.artifact)
+    results = []
+    for batch_size in args.batch_sizes:
+        df = synthetic_rows(batch_size, seed=args.seed)
+        X = df[FEATURE_NAMES]
+        repeat = max(1, min(args.batch_repeat, 100_000 // batch_size))
+
+        sklearn_s = np.median(time_calls(lambda: knn_model.predict(scaler.transform(X)), repeat))
+        fused_s = np.median(time_calls(lambda: predictor.predict(X), repeat))
+        results.append({
+            "batch_size": batch_size,
+            "sklearn_rows_per_s": batch_size / sklearn_s,
+            "fused_rows_per_s": batch_size / fused_s,
+        })
+    return results
+
+
+def synthetic_predictor(base, size, seed):
+    """
+    A predictor like ``base`` whose reference set is ``size`` synthetic rows.
+    """
+    reference = synthetic_rows(size, seed=seed)
+    scaled = (reference[FEATURE_NAMES].to_numpy(dtype=np.float64) - base.mean) / base.scale
+    return KNNPredictor(
+        scaled, np.searchsorted(base.classes, reference["target"].to_numpy()),
+        base.classes, base.mean, base.scale, n_neighbors=base.n_neighbors,
+        weights=base.weights, p=base.p,
+    )
+
+
+def bench_scaling(args):
+    base = open_artifact(args.artifact)
+    queries = synthetic_rows(args.scaling_queries, seed=args.seed + 1)[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    results = []
+    for size in args.reference_sizes:
+        predictor = synthetic_predictor(base, size, args.seed)
+        it = iter(range(args.repeat))
+        single = summarize_ms(time_calls(
+            lambda: predictor.predict_one(queries[next(it) % len(queries)]), args.repeat))
+        batch_s = np.median(time_calls(lambda: predictor.predict(queries), 3))
+        results.append({
+            "reference_size": size,
+            "single_row": single,
+            "batch_rows_per_s": len(queries) / batch_s,
+        })
+    return results
+
+
+def bench_parallel(args):
+    base = open_artifact(args.artifact)
+    predictor = synthetic_predictor(base, args.parallel_reference_size, args.seed)
+    queries = synthetic_rows(args.parallel_rows, seed=args.seed + 1)[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    results = []
+    for n_workers in args.workers:
+        with ParallelScorer.from_predictor(predictor, n_workers) as scorer:
+            scorer.warm_up()
+            elapsed = np.median(time_calls(lambda: scorer.predict(queries), 3))
+        results.append({"workers": n_workers, "rows_per_s": len(queries) / elapsed})
+    for entry in results:
+        entry["speedup"] = entry["rows_per_s"] / results[0]["rows_per_s"]
+    return {
+        "reference_size": args.parallel_reference_size,
+        "rows": args.parallel_rows,
+        "cpu_count": os.cpu_count(),
+        "runs": results,
+    }
+
+
+BENCHMARKS = {
+    "load": bench_load,
+    "startup": bench_startup,
+    "single": bench_single,
+    "batch": bench_batch,
+    "scaling": bench_scaling,
+    "parallel": bench_parallel,
+}
+
+
+def environment(args):
+    import sklearn
+
+    header = open_artifact(args.artifact).artifact
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "artifact": {
+            "model_version": header["model_version"],
+            "artifact_id": header.get("artifact_id"),
+            "reference_rows": header["arrays"]["train_scaled"]["shape"][0],
+        },
+    }
+
+
+def compare(current, baseline, path=""):
+    """
+    Yield ``(metric path, baseline, current, ratio)`` for every timing in both runs.
+    """
+    if isinstance(current, dict) and isinstance(baseline, dict):
+        for key in current:
+            if key in baseline:
+                yield from compare(current[key], baseline[key], f"{path}.{key}" if path else key)
+    elif isinstance(current, list) and isinstance(baseline, list):
+        for i, (cur, base) in enumerate(zip(current, baseline)):
+            yield from compare(cur, base, f"{path}[{i}]")
+    elif (isinstance(current, (int, float)) and isinstance(baseline, (int, float))
+          and (path.endswith("_ms") or path.endswith("_per_s")) and baseline):
+        yield path, baseline, current, current / baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the heart-disease KNN inference paths.")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--artifact", default=ARTIFACT_PATH)
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--repeat", type=int, default=1000, help="single-row samples per measurement")
+    parser.add_argument("--load-repeat", type=int, default=20)
+    parser.add_argument("--startup-repeat", type=int, default=5)
+    parser.add_argument("--batch-repeat", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1_000, 10_000])
+    parser.add_argument("--reference-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--scaling-queries", type=int, default=1_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--parallel-rows", type=int, default=20_000)
+    parser.add_argument("--parallel-reference-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # Pickles written by another scikit-learn version warn on every load.
+    warnings.filterwarnings("ignore", module="sklearn")
+
+    results = {"environment": environment(args), "results": {}}
+    for suite in args.suites:
+        start = time.perf_counter()
+        results["results"][suite] = BENCHMARKS[suite](args)
+        print(f"{suite}: done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparison against {args.baseline} (ratio = current / baseline):")
+        for path, old, new, ratio in compare(results["results"], baseline.get("results", {})):
+            print(f"  {path:<60} {old:>14.4f} -> {new:>14.4f}  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    main()
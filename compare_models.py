@@ -0,0 +1,165 @@
+"""
+Side-by-side evaluation of every saved model on one labelled CSV.
+
+The CSV is parsed once and the raw and standardized feature matrices are
+built once, then every registered model scores its view concurrently in a
+thread pool. NumPy's matrix products (the KNN search) and tree-ensemble
+``predict`` calls release the GIL, so comparing models costs about as much
+as scoring the slowest one.
+
+Registered by ``default_models``:
+
+- ``KNN``: the memory-mapped ``knn_model.mmap`` artifact (raw features; the
+  scaler is folded into the neighbor search).
+- ``Best model``: ``heart_disease_model.pkl`` as saved by the notebook or
+  train.py. Both take raw features (train.py bundles a scaled model with its
+  scaler in a ``Pipeline``); only a bare estimator from an older train.py run
+  falls back to ``training_report.json`` to learn it wants scaled ones.
+
+Run ``python compare_models.py test.csv`` for the same comparison as a table.
+"""
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from artifacts import ARTIFACT_PATH, open_artifact
+from batch_eval import StreamingEvaluator
+from metrics import METRICS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BEST_MODEL_PATH = os.path.join(BASE_DIR, "heart_disease_model.pkl")
+TRAINING_REPORT_PATH = os.path.join(BASE_DIR, "training_report.json")
+
+# ``predict`` maps a feature matrix to labels; ``scaled`` picks the view it gets.
+RegisteredModel = namedtuple("RegisteredModel", ["name", "predict", "scaled"])
+ModelResult = namedtuple("ModelResult", ["name", "labels", "seconds", "evaluator", "error"])
+
+
+def best_model_uses_scaled_features(model=None, report_path=TRAINING_REPORT_PATH):
+    """
+    Whether ``heart_disease_model.pkl`` expects standardized features.
+
+    A ``Pipeline`` (train.py) scales its own input. The notebook's XGBoost
+    model (no report) was fitted on raw features.
+    """
+    from sklearn.pipeline import Pipeline
+
+    if isinstance(model, Pipeline):
+        return False
+    try:
+        with open(report_path) as f:
+            return bool(json.load(f)["best_model"]["scaled_features"])
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def load_best_model(path=BEST_MODEL_PATH, report_path=TRAINING_REPORT_PATH):
+    """
+    Register ``heart_disease_model.pkl``; raises ImportError if its library is missing.
+    """
+    import joblib
+
+    model = joblib.load(path)
+    return RegisteredModel("Best model", model.predict, best_model_uses_scaled_features(model, report_path))
+
+
+def knn_model(knn_predict):
+    """
+    Register the KNN; ``knn_predict`` is ``KNNPredictor.predict`` or a ``ParallelScorer``'s.
+    """
+    return RegisteredModel("KNN", lambda X: knn_predict(X).labels, False)
+
+
+def default_models(predictor, best_model_path=BEST_MODEL_PATH):
+    """
+    Return ``(models, skipped)``: the registered models and ``{name: reason}``
+    for saved models that could not be loaded.
+    """
+    models = [knn_model(predictor.predict)]
+    skipped = {}
+    try:
+        models.append(load_best_model(best_model_path))
+    except FileNotFoundError:
+        skipped["Best model"] = f"{os.path.basename(best_model_path)} not found"
+    except ImportError as e:
+        skipped["Best model"] = f"cannot unpickle {os.path.basename(best_model_path)} ({e})"
+    return models, skipped
+
+
+def _score(model, X, y, labels):
+    start = time.perf_counter()
+    try:
+        with METRICS.timer("score", model=model.name):
+            preds = np.asarray(model.predict(X))
+    except Exception as e:
+        METRICS.inc("heart_errors_total", stage="score")
+        return ModelResult(model.name, None, time.perf_counter() - start, None, e)
+    seconds = time.perf_counter() - start
+
+    evaluator = StreamingEvaluator(labels=labels)
+    try:
+        evaluator.update(y, preds)
+    except ValueError as e:
+        return ModelResult(model.name, preds, seconds, None, e)
+    return ModelResult(model.name, preds, seconds, evaluator, None)
+
+
+def compare_models(models, X_raw, X_scaled, y, labels, max_workers=None):
+    """
+    Score every model concurrently; returns ``(results, wall_seconds)``.
+
+    ``results`` follow the order of ``models``. A model that raises gets a
+    result with ``error`` set instead of stopping the others.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or len(models)) as pool:
+        futures = [
+            pool.submit(_score, model, X_scaled if model.scaled else X_raw, y, labels)
+            for model in models
+        ]
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def feature_views(predictor, X):
+    """
+    Raw float64 matrix and its standardized copy, each computed once.
+    """
+    X_raw = predictor.as_matrix(X)
+    return X_raw, predictor.transform(X_raw)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare every saved model on a labelled CSV.")
+    parser.add_argument("csv")
+    parser.add_argument("--artifact", default=ARTIFACT_PATH)
+    parser.add_argument("--best-model", default=BEST_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+
+    predictor = open_artifact(args.artifact)
+    df = pd.read_csv(args.csv)
+    X_raw, X_scaled = feature_views(predictor, df.drop("target", axis=1))
+    models, skipped = default_models(predictor, args.best_model)
+    for name, reason in skipped.items():
+        print(f"Skipping {name}: {reason}")
+
+    results, wall = compare_models(models, X_raw, X_scaled, df["target"].to_numpy(), predictor.classes)
+    print(f"{'model':<12} {'accuracy':>9} {'score ms':>9}")
+    for result in results:
+        if result.error is not None:
+            print(f"{result.name:<12} {'error':>9} {result.seconds * 1e3:>9.1f}  {result.error}")
+        else:
+            print(f"{result.name:<12} {result.evaluator.accuracy:>9.4f} {result.seconds * 1e3:>9.1f}")
+    print(f"{len(df):,} rows; wall time {wall * 1e3:.1f} ms "
+          f"(sum of models {sum(r.seconds for r in results) * 1e3:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Cardiologist directory with a nearest-doctor spatial index.
+
+The directory lives in ``cardiologists.csv`` (name, contact, qualification,
+state, latitude, longitude) and is read with the standard ``csv`` module, so
+the apps keep their NumPy-only import footprint.
+
+``DoctorDirectory.nearest`` returns the k doctors closest to a location by
+great-circle distance, across all states. Rows are grouped into latitude bands
+and sorted by longitude within each band, so the doctors inside a lat/lon box
+are a few contiguous slices. A query doubles a search radius until its box
+holds k doctors, then re-reads the box for the k-th distance found, which
+guarantees no closer doctor was left out. The results are exactly those of a
+full scan, ties going to the earlier row of the file.
+
+Run ``python doctors.py --synthetic 50000`` to compare it with a full scan.
+"""
+import argparse
+import csv
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DOCTORS_PATH = os.path.join(BASE_DIR, "cardiologists.csv")
+
+EARTH_RADIUS_KM = 6371.0088
+COLUMNS = ["name", "contact", "qualification", "state", "latitude", "longitude"]
+
+Doctor = namedtuple("Doctor", COLUMNS)
+
+
+def map_url(doctor):
+    """
+    Embeddable Google Maps URL centered on ``doctor``.
+    """
+    return f"https://www.google.com/maps?q={doctor.latitude:.4f},{doctor.longitude:.4f}&output=embed"
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    Great-circle distances in km from one point to arrays of points (all in radians).
+    """
+    a = (np.sin((lats - lat) / 2.0) ** 2
+         + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2.0) ** 2)
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class DoctorDirectory:
+    """
+    Doctors plus a latitude-band grid answering exact k-nearest queries.
+    """
+
+    def __init__(self, doctors, band_deg=0.25):
+        self.doctors = list(doctors)
+        lats = np.radians(np.array([d.latitude for d in self.doctors], dtype=np.float64))
+        lons = np.radians(np.array([d.longitude for d in self.doctors], dtype=np.float64))
+        if not np.all(np.abs(lats) <= np.pi / 2):
+            raise ValueError("Doctor latitudes must lie in [-90, 90]")
+
+        # Rows grouped by latitude band, sorted by longitude within a band.
+        self._band = np.radians(band_deg)
+        self._n_bands = int(np.ceil(np.pi / self._band)) + 1
+        bands = self._band_of(lats)
+        self._order = np.lexsort((lons, bands))
+        self._lats = lats[self._order]
+        self._lons = lons[self._order]
+        self._offsets = np.searchsorted(bands[self._order], np.arange(self._n_bands + 1))
+
+    def _band_of(self, lats):
+        return np.floor((np.asarray(lats) + np.pi / 2) / self._band).astype(np.intp)
+
+    @classmethod
+    def from_csv(cls, path=DOCTORS_PATH, **kwargs):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            missing = [c for c in COLUMNS if c not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"{path} is missing columns: {missing}")
+            doctors = [
+                Doctor(row["name"], row["contact"], row["qualification"], row["state"],
+                       float(row["latitude"]), float(row["longitude"]))
+                for row in reader
+            ]
+        return cls(doctors, **kwargs)
+
+    def __len__(self):
+        return len(self.doctors)
+
+    @property
+    def states(self):
+        return sorted({d.state for d in self.doctors})
+
+    def nearest(self, latitude, longitude, k=5):
+        """
+        Return ``(doctors, distances_km)`` of the ``k`` doctors closest to a location.
+        """
+        k = min(int(k), len(self.doctors))
+        if k <= 0:
+            return [], np.empty(0)
+        lat, lon = np.radians(latitude), np.radians(longitude)
+
+        # Grow the search radius until it holds k doctors, then widen it once
+        # more to the k-th distance so no closer doctor can lie outside it.
+        radius = self._band * EARTH_RADIUS_KM
+        while True:
+            rows = self._rows_within(lat, lon, radius)
+            if len(rows) >= k or radius >= np.pi * EARTH_RADIUS_KM:
+                break
+            radius *= 2.0
+        distances = haversine_km(lat, lon, self._lats[rows], self._lons[rows])
+        kth = np.partition(distances, k - 1)[k - 1]
+        if kth > radius:
+            rows = self._rows_within(lat, lon, kth)
+            distances = haversine_km(lat, lon, self._lats[rows], self._lons[rows])
+
+        indices = self._order[rows]
+        best = np.lexsort((indices, distances))[:k]
+        return [self.doctors[i] for i in indices[best]], distances[best]
+
+    def _rows_within(self, lat, lon, radius_km):
+        """
+        Sorted-row positions inside a lat/lon box that contains the disk of ``radius_km``.
+        """
+        angle = radius_km / EARTH_RADIUS_KM
+        lat_lo, lat_hi = lat - angle, lat + angle
+        # Longitude half-width of the disk; the whole circle near the poles.
+        ratio = np.sin(min(angle, np.pi / 2)) / np.cos(lat)
+        if lat_lo <= -np.pi / 2 or lat_hi >= np.pi / 2 or ratio >= 1.0:
+            spans = [(-np.inf, np.inf)]
+        else:
+            half = np.arcsin(ratio)
+            lo, hi = lon - half, lon + half
+            spans = [(lo, hi)]
+            if lo < -np.pi:
+                spans = [(-np.pi, hi), (lo + 2 * np.pi, np.pi)]
+            elif hi > np.pi:
+                spans = [(lo, np.pi), (-np.pi, hi - 2 * np.pi)]
+
+        first, last = self._band_of([max(lat_lo, -np.pi / 2), min(lat_hi, np.pi / 2)])
+        ranges = []
+        for band in range(first, min(last, self._n_bands - 1) + 1):
+            start, stop = self._offsets[band], self._offsets[band + 1]
+            if start == stop:
+                continue
+            lons = self._lons[start:stop]
+            for span_lo, span_hi in spans:
+                a = start + np.searchsorted(lons, span_lo, side="left")
+                b = start + np.searchsorted(lons, span_hi, side="right")
+                if a < b:
+                    ranges.append(np.arange(a, b))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.intp)
+
+    def page(self, latitude, longitude, page=0, page_size=5):
+        """
+        One page of doctors ordered by distance; returns ``(doctors, distances_km)``.
+        """
+        start = max(0, int(page)) * int(page_size)
+        doctors, distances = self.nearest(latitude, longitude, start + int(page_size))
+        return doctors[start:], distances[start:]
+
+
+def synthetic_doctors(n, source, seed=0, spread_deg=0.5):
+    """
+    ``n`` made-up doctors scattered around the locations in ``source``.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(source), size=n)
+    jitter = rng.normal(0.0, spread_deg, size=(n, 2))
+    return [
+        Doctor(f"Dr. Synthetic {i}", "", "MD, Cardiologist", source[j].state,
+               float(np.clip(source[j].latitude + dy, -90.0, 90.0)),
+               float((source[j].longitude + dx + 180.0) % 360.0 - 180.0))
+        for i, (j, (dy, dx)) in enumerate(zip(picks, jitter))
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or benchmark the cardiologist directory.")
+    parser.add_argument("--path", default=DOCTORS_PATH)
+    parser.add_argument("--lat", type=float, default=None)
+    parser.add_argument("--lon", type=float, default=None)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="benchmark against a full scan over this many synthetic doctors")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    directory = DoctorDirectory.from_csv(args.path)
+    if not args.synthetic:
+        if args.lat is None or args.lon is None:
+            parser.error("--lat and --lon are required unless --synthetic is given")
+        doctors, distances = directory.nearest(args.lat, args.lon, args.k)
+        for doctor, km in zip(doctors, distances):
+            print(f"{km:8.1f} km  {doctor.name:<24} {doctor.state:<16} {doctor.contact}")
+        return
+
+    directory = DoctorDirectory(synthetic_doctors(args.synthetic, directory.doctors, seed=args.seed))
+    rng = np.random.default_rng(args.seed + 1)
+    lats = np.array([d.latitude for d in directory.doctors])
+    lons = np.array([d.longitude for d in directory.doctors])
+    queries = np.column_stack([
+        rng.uniform(lats.min(), lats.max(), args.queries),
+        rng.uniform(lons.min(), lons.max(), args.queries),
+    ])
+
+    start = time.perf_counter()
+    results = [directory.nearest(qlat, qlon, args.k)[1] for qlat, qlon in queries]
+    index_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mismatches = 0
+    for (qlat, qlon), got in zip(queries, results):
+        d = haversine_km(np.radians(qlat), np.radians(qlon), np.radians(lats), np.radians(lons))
+        expected = np.sort(d)[:args.k]
+        mismatches += not np.allclose(got, expected, rtol=0.0, atol=1e-9)
+    scan_s = time.perf_counter() - start
+
+    print(f"{args.synthetic} doctors, {args.queries} queries, k={args.k}")
+    print(f"  index:     {index_s / args.queries * 1e3:.3f} ms/query")
+    print(f"  full scan: {scan_s / args.queries * 1e3:.3f} ms/query")
+    print(f"  queries with different distances: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+import os
+
 import streamlit as st
-import joblib
-import pandas as pd
+
+from artifacts import artifact_stamp, open_artifact, serving_index
+from doctors import DOCTORS_PATH, DoctorDirectory, map_url
+from metrics import METRICS, export_from_env, render_debug_panel, serve_from_env
+from prediction_cache import CachedPredictor, PredictionCache
+from service import predict_remote
 
 # PAGE CONFIG
 st.set_page_config(
@@ -10,15 +16,34 @@ st.set_page_config(
 )
 
 # LOAD MODEL AND SCALER
+BASE_DIR = os.path.dirname(__file__)
+ARTIFACT_PATH = os.path.join(BASE_DIR, "knn_model.mmap")
+
+# Keyed on the artifact's file stamp, so a version published by
+# update_model.py is picked up on the next rerun without a restart.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_artifacts(stamp):
+    with METRICS.timer("load_artifacts"):
+        return open_artifact(ARTIFACT_PATH, index=serving_index())
+
+# One prediction cache shared by every session of this server process
 @st.cache_resource(show_spinner=False)
-def load_artifacts():
-    import os
-    BASE_DIR = os.path.dirname(__file__)
-    model = joblib.load(os.path.join(BASE_DIR, "knn_model.pkl"))
-    scaler = joblib.load(os.path.join(BASE_DIR, "scaler.pkl"))
-    return model, scaler
+def load_prediction_cache():
+    return PredictionCache(maxsize=10_000)
+
+# Set HEART_SERVICE_URL (e.g. http://127.0.0.1:8600) to send predictions to a
+# running service.py instead of loading the model in this process.
+SERVICE_URL = os.environ.get("HEART_SERVICE_URL")
+
+
+# Resolved on every run that predicts, fragment reruns included: those do not
+# re-execute this module, so a module-level predictor would stay on the
+# version that was current when the page was first loaded.
+def current_predictor():
+    return CachedPredictor(load_artifacts(artifact_stamp(ARTIFACT_PATH)), load_prediction_cache())
 
-knn_model, scaler = load_artifacts()
+# Optional /metrics endpoint (HEART_METRICS_PORT), started once per process
+serve_from_env()
 
 # STYLING + ANIMATION + DOCTOR CARD CSS
 st.markdown("""
@@ -129,14 +154,29 @@ st.title("❤ Heart Disease Model prediction using KNN")
 st.markdown("Enter values and get real-time prediction.")
 
 # MANUAL INPUT FORM
-feature_names = [
-    "age", "sex", "cp", "trestbps", "chol", "fbs",
-    "restecg", "thalach", "exang", "oldpeak", "slope", "ca", "thal"
-]
+# A fragment: submitting the form reruns only this section, not the page
+# (CSS, directory, ...). The last result lives in session state, so it is
+# redrawn without recomputation on full-page reruns.
+def render_prediction(result):
+    prediction, proba = result
+    prob_no_disease = proba[0] * 100
+    prob_disease = proba[1] * 100
+
+    with METRICS.timer("render"):
+        if prediction == 1:
+            st.markdown(
+                f'<div class="result-error"><span class="result-icon">🚨</span> '
+                f'*Prediction: Likely Heart Disease* ({prob_disease:.2f}%)</div>',
+                unsafe_allow_html=True)
+        else:
+            st.markdown(
+                f'<div class="result-success"><span class="result-icon">✅</span> '
+                f'*Prediction: No Heart Disease* ({prob_no_disease:.2f}%)</div>',
+                unsafe_allow_html=True)
 
-with st.container():
-    st.markdown('<div class="manual-input-container">', unsafe_allow_html=True)
 
+@st.fragment
+def prediction_form():
     with st.form("manual_input_form"):
         st.subheader("🧮 Input")
 
@@ -162,91 +202,100 @@ with st.container():
         submitted = st.form_submit_button("🔍 Predict")
 
         if submitted:
-            input_data = [[
+            input_data = [
                 age, sex, cp, trestbps, chol, fbs, restecg,
                 thalach, exang, oldpeak, slope, ca, thal
-            ]]
+            ]
             try:
-                input_df = pd.DataFrame(input_data, columns=feature_names)
-                input_scaled = scaler.transform(input_df)
-                prediction = knn_model.predict(input_scaled)[0]
-                proba = knn_model.predict_proba(input_scaled)[0]
-                prob_no_disease = proba[0] * 100
-                prob_disease = proba[1] * 100
-
-                if prediction == 1:
-                    st.markdown(
-                        f'<div class="result-error"><span class="result-icon">🚨</span> '
-                        f'*Prediction: Likely Heart Disease* ({prob_disease:.2f}%)</div>',
-                        unsafe_allow_html=True)
-                else:
-                    st.markdown(
-                        f'<div class="result-success"><span class="result-icon">✅</span> '
-                        f'*Prediction: No Heart Disease* ({prob_no_disease:.2f}%)</div>',
-                        unsafe_allow_html=True)
-
+                with METRICS.timer("predict"):
+                    if SERVICE_URL:
+                        prediction, proba, _ = predict_remote(SERVICE_URL, input_data)
+                    else:
+                        prediction, proba, _ = current_predictor().predict_one(input_data)
+                st.session_state["last_prediction"] = (int(prediction), [float(p) for p in proba])
             except Exception as e:
+                METRICS.inc("heart_errors_total", stage="predict")
+                st.session_state.pop("last_prediction", None)
                 st.error(f"⚠ Prediction error: {e}")
 
+        if "last_prediction" in st.session_state:
+            render_prediction(st.session_state["last_prediction"])
+
+
+with st.container():
+    st.markdown('<div class="manual-input-container">', unsafe_allow_html=True)
+    prediction_form()
     st.markdown('</div>', unsafe_allow_html=True)
 
 
 # ---------------------------------------------------
-# DOCTOR INFO DATA
-doctors_by_state = {
-    "Maharashtra": [
-        {"name": "Dr. A. Joshi", "contact": "+91 9876543210", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=18.5204,73.8567&output=embed"},
-        {"name": "Dr. M. Deshmukh", "contact": "+91 9876543211", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=19.0760,72.8777&output=embed"},
-        {"name": "Dr. R. Kulkarni", "contact": "+91 9876543212", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=21.1458,79.0882&output=embed"},
-        {"name": "Dr. S. Gokhale", "contact": "+91 9876543213", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=19.8762,75.3433&output=embed"},
-        {"name": "Dr. P. Kamat", "contact": "+91 9876543214", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=20.0111,73.7903&output=embed"},
-    ],
-    "Karnataka": [
-        {"name": "Dr. V. Rao", "contact": "+91 9123456789", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=12.9716,77.5946&output=embed"},
-        {"name": "Dr. N. Kumar", "contact": "+91 9123456790", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=15.3173,75.7139&output=embed"},
-        {"name": "Dr. S. Shetty", "contact": "+91 9123456791", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=13.1986,77.7066&output=embed"},
-        {"name": "Dr. R. Patil", "contact": "+91 9123456792", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=15.9129,74.8410&output=embed"},
-        {"name": "Dr. M. Fernandes", "contact": "+91 9123456793", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=12.2958,76.6394&output=embed"},
-    ],
-    "Tamil Nadu": [
-        {"name": "Dr. K. Ramesh", "contact": "+91 9988776655", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=13.0827,80.2707&output=embed"},
-        {"name": "Dr. S. Balaji", "contact": "+91 9988776656", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=11.0168,76.9558&output=embed"},
-        {"name": "Dr. L. Kumar", "contact": "+91 9988776657", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=10.7905,78.7047&output=embed"},
-        {"name": "Dr. P. Mani", "contact": "+91 9988776658", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=9.9252,78.1198&output=embed"},
-        {"name": "Dr. M. Sekar", "contact": "+91 9988776659", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=12.2958,76.6394&output=embed"},
-    ],
-    "Delhi": [
-        {"name": "Dr. A. Singh", "contact": "+91 9876541234", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=28.6139,77.2090&output=embed"},
-        {"name": "Dr. N. Sharma", "contact": "+91 9876541235", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=28.7041,77.1025&output=embed"},
-        {"name": "Dr. R. Gupta", "contact": "+91 9876541236", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=28.5355,77.3910&output=embed"},
-        {"name": "Dr. S. Verma", "contact": "+91 9876541237", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=28.4595,77.0266&output=embed"},
-        {"name": "Dr. P. Mehta", "contact": "+91 9876541238", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=28.4089,77.3178&output=embed"},
-    ],
-    "West Bengal": [
-        {"name": "Dr. R. Chatterjee", "contact": "+91 9123459876", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=22.5726,88.3639&output=embed"},
-        {"name": "Dr. S. Das", "contact": "+91 9123459877", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=23.8103,87.5234&output=embed"},
-        {"name": "Dr. L. Mukherjee", "contact": "+91 9123459878", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=22.9786,87.7478&output=embed"},
-        {"name": "Dr. M. Sen", "contact": "+91 9123459879", "qualification": "DM, Cardiologist", "map_url": "https://www.google.com/maps?q=24.4539,87.3119&output=embed"},
-        {"name": "Dr. T. Bhattacharya", "contact": "+91 9123459880", "qualification": "MD, Cardiologist", "map_url": "https://www.google.com/maps?q=22.8456,88.3621&output=embed"},
-    ],
-}
+# DOCTOR DIRECTORY (cardiologists.csv, indexed by location)
+@st.cache_resource(show_spinner=False)
+def load_doctor_directory():
+    return DoctorDirectory.from_csv(DOCTORS_PATH)
+
+# Per-state starting points; plain data, so cached with st.cache_data.
+@st.cache_data(show_spinner=False)
+def state_centres():
+    directory = load_doctor_directory()
+    centres = {}
+    for state in directory.states:
+        doctors = [d for d in directory.doctors if d.state == state]
+        centres[state] = (sum(d.latitude for d in doctors) / len(doctors),
+                          sum(d.longitude for d in doctors) / len(doctors))
+    return centres
+
+DOCTORS_PER_PAGE = 5
 
 # DOCTOR INFORMATION SECTION
 st.markdown("---")
 st.header("Find Cardiologists Near You")
 
-state = st.selectbox("Select Your State", options=list(doctors_by_state.keys()))
-
-if state:
-    st.markdown(f"### Cardiologists in {state}")
-    doctors = doctors_by_state[state]
-
-    for doc in doctors:
-        st.markdown(f'''
-        <div class="doctor-card">
-            <div class="doctor-name">{doc["name"]}</div>
-            <div class="doctor-info"><strong>Contact:</strong> {doc["contact"]}</div>
-            <div class="doctor-info"><strong>Qualification:</strong> {doc["qualification"]}</div>
-            <iframe src="{doc["map_url"]}" width="100%" height="200" loading="lazy" allowfullscreen></iframe>
-        </div>
-        ''', unsafe_allow_html=True)
\ No newline at end of file
+# A fragment: changing the state, location or page, or opening a map, reruns
+# only this section instead of the whole page.
+@st.fragment
+def doctor_directory():
+    directory = load_doctor_directory()
+    if len(directory) == 0:
+        st.info("No doctors listed.")
+        return
+    centres = state_centres()
+
+    # Start from the centre of the chosen state's doctors; the coordinates can
+    # be edited to search from any location, across all states.
+    state = st.selectbox("Select Your State", options=list(centres))
+    col1, col2 = st.columns(2)
+    with col1:
+        latitude = st.number_input("Latitude", min_value=-90.0, max_value=90.0, format="%.4f",
+                                   key=f"lat-{state}", value=centres[state][0])
+    with col2:
+        longitude = st.number_input("Longitude", min_value=-180.0, max_value=180.0, format="%.4f",
+                                    key=f"lon-{state}", value=centres[state][1])
+
+    n_pages = max(1, -(-len(directory) // DOCTORS_PER_PAGE))
+    page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1) - 1
+
+    with METRICS.timer("doctor_lookup"):
+        doctors, distances = directory.page(latitude, longitude, page, DOCTORS_PER_PAGE)
+
+    st.markdown(f"### Nearest cardiologists ({page * DOCTORS_PER_PAGE + 1}-{page * DOCTORS_PER_PAGE + len(doctors)} of {len(directory)})")
+    for doc, km in zip(doctors, distances):
+        with st.expander(f"{doc.name} - {doc.state} ({km:.1f} km)"):
+            st.markdown(f'''
+            <div class="doctor-card">
+                <div class="doctor-name">{doc.name}</div>
+                <div class="doctor-info"><strong>Contact:</strong> {doc.contact}</div>
+                <div class="doctor-info"><strong>Qualification:</strong> {doc.qualification}</div>
+            </div>
+            ''', unsafe_allow_html=True)
+            # The map iframe is only sent to the browser once it is asked for.
+            if st.toggle("Show map", key=f"map-{doc.name}-{doc.latitude}-{doc.longitude}"):
+                st.markdown(f'<iframe src="{map_url(doc)}" width="100%" height="200" loading="lazy" allowfullscreen></iframe>',
+                            unsafe_allow_html=True)
+
+doctor_directory()
+
+
+# DEBUG PANEL (?debug=1) + OPTIONAL METRICS FILE DUMP
+render_debug_panel()
+export_from_env()
@@ -0,0 +1,261 @@
+"""
+Fast k / weights / metric selection for the KNN model.
+
+A grid search refits and re-queries ``KNeighborsClassifier`` for every
+candidate, recomputing every distance each time. The only thing that differs
+between candidates with the same metric is how many of the *same* sorted
+neighbors vote and how they are weighted, so this module:
+
+1. ranks, in memory-bounded blocks, the ``k_max`` nearest training rows of every
+   validation row once per (fold, metric);
+2. scores every ``k <= k_max`` with uniform and distance weights at once from
+   cumulative class votes along that ranking.
+
+Both leave-one-out (the row itself is excluded from its own ranking) and
+stratified k-fold CV are supported. Votes follow scikit-learn exactly: ties go
+to the lowest class, and with distance weights an exact match takes all of the
+weight.
+
+CLI::
+
+    python knn_sweep.py --k-max 50 --p 1 2 --export knn_model.mmap
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from predictor import DEFAULT_BLOCK_ELEMENTS, FEATURE_NAMES, KNNPredictor, minkowski_distances, top_k
+from synthetic import DATASET_PATH, load_dataset
+
+WEIGHTS = ("uniform", "distance")
+
+
+def rank_neighbors(train, queries, k_max, p=2, exclude_self=False,
+                   block_elements=DEFAULT_BLOCK_ELEMENTS):
+    """
+    ``(distances, indices)`` of the ``k_max`` nearest ``train`` rows per query, closest first.
+
+    With ``exclude_self`` the queries are the training rows themselves and row
+    ``i`` is left out of its own ranking (leave-one-out).
+    """
+    k_max = min(k_max, train.shape[0] - int(exclude_self))
+    n_queries = queries.shape[0]
+    distances = np.empty((n_queries, k_max), dtype=np.float64)
+    indices = np.empty((n_queries, k_max), dtype=np.intp)
+    sq_train = np.einsum("ij,ij->i", train, train)
+
+    per_query = train.shape[0] * (1 if p == 2 else train.shape[1])
+    step = max(1, block_elements // per_query)
+    for start in range(0, n_queries, step):
+        stop = min(start + step, n_queries)
+        block = queries[start:stop]
+        if p == 2:
+            scores = sq_train - 2.0 * (block @ train.T)
+        else:
+            scores = np.sum(np.abs(block[:, None, :] - train[None, :, :]) ** p, axis=2)
+        if exclude_self:
+            rows = np.arange(stop - start)
+            scores[rows, start + rows] = np.inf
+        idx = top_k(scores, k_max)
+        indices[start:stop] = idx
+        distances[start:stop] = minkowski_distances(block, train[idx], p)
+    return distances, indices
+
+
+def correct_by_k(distances, neighbor_y, y_true, n_classes):
+    """
+    Per-row hits for every ``k = 1..k_max`` and both weightings.
+
+    ``neighbor_y`` holds class indices of the ranked neighbors. Returns
+    ``{"uniform": (n, k_max) bool, "distance": (n, k_max) bool}``.
+    """
+    onehot = (neighbor_y[:, :, None] == np.arange(n_classes)).astype(np.float64)
+    truth = y_true[:, None]
+
+    uniform = np.cumsum(onehot, axis=1)
+
+    exact = distances == 0.0
+    with np.errstate(divide="ignore"):
+        inverse = np.where(exact, 0.0, 1.0 / distances)
+    inverse_votes = np.cumsum(onehot * inverse[:, :, None], axis=1)
+    exact_votes = np.cumsum(onehot * exact[:, :, None], axis=1)
+    has_exact = np.cumsum(exact, axis=1) > 0
+    distance = np.where(has_exact[:, :, None], exact_votes, inverse_votes)
+
+    return {
+        "uniform": np.argmax(uniform, axis=2) == truth,
+        "distance": np.argmax(distance, axis=2) == truth,
+    }
+
+
+def _entries(hits_per_fold, ks, weights, p):
+    entries = []
+    for w in weights:
+        for k in ks:
+            scores = [hits[w][:, k - 1].mean() for hits in hits_per_fold]
+            entries.append({
+                "params": {"n_neighbors": int(k), "weights": w, "p": p},
+                "cv_mean": float(np.mean(scores)),
+                "cv_std": float(np.std(scores)),
+                "fold_scores": [float(s) for s in scores],
+            })
+    return entries
+
+
+def sweep_folds(folds, ks, weights=WEIGHTS, ps=(2,), block_elements=DEFAULT_BLOCK_ELEMENTS):
+    """
+    CV accuracy of every (k, weights, p) from one ranking per (fold, p).
+
+    ``folds`` yields already scaled ``(X_train, y_train, X_val, y_val)``.
+    Returns entries shaped like ``train.run_search`` results.
+    """
+    folds = list(folds)
+    classes = np.unique(np.concatenate([y for fold in folds for y in (fold[1], fold[3])]))
+    k_max = max(ks)
+    if k_max > min(len(fold[0]) for fold in folds):
+        raise ValueError(f"k={k_max} exceeds the smallest training fold")
+
+    results = []
+    for p in ps:
+        hits_per_fold = []
+        for X_train, y_train, X_val, y_val in folds:
+            distances, indices = rank_neighbors(X_train, X_val, k_max, p, block_elements=block_elements)
+            neighbor_y = np.searchsorted(classes, y_train)[indices]
+            hits_per_fold.append(correct_by_k(distances, neighbor_y, np.searchsorted(classes, y_val), len(classes)))
+        results.extend(_entries(hits_per_fold, ks, weights, p))
+    return results
+
+
+def sweep_loo(X_scaled, y, ks, weights=WEIGHTS, ps=(2,), block_elements=DEFAULT_BLOCK_ELEMENTS):
+    """
+    Leave-one-out accuracy of every (k, weights, p) from one ranking per metric.
+
+    ``X_scaled`` is scaled once on all rows; ``cv_std`` is the spread of the
+    per-row hits.
+    """
+    classes, y_idx = np.unique(y, return_inverse=True)
+    k_max = max(ks)
+    if k_max > len(X_scaled) - 1:
+        raise ValueError(f"k={k_max} needs more than {len(X_scaled)} rows")
+
+    results = []
+    for p in ps:
+        distances, indices = rank_neighbors(X_scaled, X_scaled, k_max, p, exclude_self=True,
+                                            block_elements=block_elements)
+        hits = correct_by_k(distances, y_idx[indices], y_idx, len(classes))
+        for entry in _entries([hits], ks, weights, p):
+            entry["cv_std"] = float(np.std(hits[entry["params"]["weights"]][:, entry["params"]["n_neighbors"] - 1]))
+            del entry["fold_scores"]
+            results.append(entry)
+    return results
+
+
+def select_best(results):
+    """
+    Highest accuracy; ties prefer smaller k, uniform weights, then Euclidean.
+    """
+    return max(results, key=lambda e: (
+        e["cv_mean"], -e["params"]["n_neighbors"], e["params"]["weights"] == "uniform", e["params"]["p"] == 2,
+    ))
+
+
+def _gridsearch(X_train, y_train, ks, weights, ps, cv):
+    from sklearn.model_selection import GridSearchCV
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.pipeline import Pipeline
+
+    search = GridSearchCV(
+        Pipeline([("scaler", StandardScaler()), ("knn", KNeighborsClassifier())]),
+        {"knn__n_neighbors": list(ks), "knn__weights": list(weights), "knn__p": list(ps)},
+        cv=cv,
+    )
+    search.fit(X_train, y_train)
+    return {
+        (params["knn__n_neighbors"], params["knn__weights"], params["knn__p"]): score
+        for params, score in zip(search.cv_results_["params"], search.cv_results_["mean_test_score"])
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Select KNN k / weights / metric from one neighbor ranking.")
+    parser.add_argument("--data", default=DATASET_PATH)
+    parser.add_argument("--k-max", type=int, default=50)
+    parser.add_argument("--weights", nargs="+", choices=WEIGHTS, default=list(WEIGHTS))
+    parser.add_argument("--p", type=int, nargs="+", default=[2], help="Minkowski powers to try")
+    parser.add_argument("--cv", type=int, default=5, help="stratified folds (ignored with --loo)")
+    parser.add_argument("--loo", action="store_true", help="leave-one-out instead of k-fold")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--top", type=int, default=10, help="candidates to print")
+    parser.add_argument("--compare-gridsearch", action="store_true",
+                        help="also run GridSearchCV over the same grid and check the scores agree")
+    parser.add_argument("--export", default=None, help="write the selected model as a memmap artifact here")
+    parser.add_argument("--model-version", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    df = load_dataset(args.data)
+    X = df[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    y = df["target"].to_numpy()
+    # Same split as the notebook; the held-out rows never influence the choice.
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    ks = range(1, args.k_max + 1)
+
+    start = time.perf_counter()
+    if args.loo:
+        scaler = StandardScaler().fit(X_train)
+        results = sweep_loo(scaler.transform(X_train), y_train, ks, args.weights, args.p)
+        cv = None
+    else:
+        cv = StratifiedKFold(args.cv, shuffle=True, random_state=args.seed)
+        folds = []
+        for train_idx, val_idx in cv.split(X_train, y_train):
+            fold_scaler = StandardScaler().fit(X_train[train_idx])
+            folds.append((fold_scaler.transform(X_train[train_idx]), y_train[train_idx],
+                          fold_scaler.transform(X_train[val_idx]), y_train[val_idx]))
+        results = sweep_folds(folds, ks, args.weights, args.p)
+    sweep_s = time.perf_counter() - start
+
+    best = select_best(results)
+    print(f"{len(results)} candidates scored in {sweep_s * 1e3:.1f} ms "
+          f"({'leave-one-out' if args.loo else f'{args.cv}-fold CV'})")
+    for entry in sorted(results, key=lambda e: -e["cv_mean"])[:args.top]:
+        print(f"  {entry['cv_mean']:.4f} +/- {entry['cv_std']:.4f}  {entry['params']}")
+
+    if args.compare_gridsearch:
+        if cv is None:
+            from sklearn.model_selection import LeaveOneOut
+
+            cv = LeaveOneOut()
+        start = time.perf_counter()
+        grid = _gridsearch(X_train, y_train, ks, args.weights, args.p, cv)
+        grid_s = time.perf_counter() - start
+        if args.loo:
+            print("Note: GridSearchCV refits the scaler per left-out row; the sweep scales once.")
+        diff = max(abs(grid[(e["params"]["n_neighbors"], e["params"]["weights"], e["params"]["p"])] - e["cv_mean"])
+                   for e in results)
+        print(f"GridSearchCV: {grid_s:.2f} s ({grid_s / sweep_s:.0f}x slower), max score difference {diff:.2e}")
+
+    scaler = StandardScaler().fit(X_train)
+    params = best["params"]
+    predictor = KNNPredictor(
+        scaler.transform(X_train), np.searchsorted(np.unique(y_train), y_train), np.unique(y_train),
+        scaler.mean_, scaler.scale_, n_neighbors=params["n_neighbors"], weights=params["weights"],
+        p=params["p"], feature_names=FEATURE_NAMES,
+    )
+    test_acc = float(np.mean(predictor.predict(X_test).labels == y_test))
+    print(f"Selected {params} (CV {best['cv_mean']:.4f}, held-out test {test_acc:.4f})")
+
+    if args.export:
+        from artifacts import write_artifact
+
+        selection = {"method": "loo" if args.loo else f"{args.cv}-fold", "cv_accuracy": best["cv_mean"],
+                     "test_accuracy": test_acc, "params": params}
+        write_artifact(args.export, predictor, model_version=args.model_version,
+                       metadata={"source": "knn_sweep.py", "selection": selection})
+        print(f"Wrote {args.export}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""
+Load and soak test harness for the Streamlit apps.
+
+Starts ``streamlit run`` for manual.py, dui.py or ui_heart-disease.py and
+drives many concurrent simulated sessions against it with a headless client
+that speaks Streamlit's own websocket protocol, so the server does exactly
+the work a browser would cause. Every session opens the page, then replays
+interactions:
+
+- ``manual`` / ``dui``: fills the input form with a row of the Cleveland CSV
+  and submits it; dui.py sessions also switch the cardiologist state.
+- ``batch``: uploads a CSV (``--csv``, default test.csv) through the upload
+  endpoint, which scores it, then flips comparison mode on and off.
+
+Each concurrency level (``--sessions 1 8 32``) reports throughput, latency
+percentiles of page opens and interactions (request to ``script_finished``),
+errors, and the server's resident memory growth per session. With
+``--duration`` every session keeps interacting until the time is up (soak
+mode); the RSS slope over the run exposes leaks. Levels share one server, so the
+first level's memory growth includes the one-off imports and artifact load;
+start with ``--sessions 1`` as a warm-up when per-session growth matters.
+
+The server is started with ``HEART_METRICS_PORT``, and its ``/metrics``
+endpoint (see metrics.py) shows whether ``@st.cache_resource`` really is
+shared across sessions: ``artifact_loads`` counts how many times the app
+opened the model artifact during a level (at most 1 when shared) and
+``prediction_cache`` gives the hit rate of the process-wide prediction cache.
+
+Results are JSON, comparable with an earlier run like benchmark.py's::
+
+    python loadtest.py --apps dui batch --sessions 1 8 32 --output load-v2.json --baseline load-v1.json
+
+Requires the ``websockets`` package. The client builds Streamlit's internal
+protobuf messages (``streamlit.proto``) and encodes widget values the way
+Streamlit 1.65 does (number inputs as doubles, select boxes as option
+strings); those internals are not a stable API, so re-check the harness when
+moving the ``streamlit>=1.65`` pin in requirements.txt.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmark import compare, summarize_ms
+from synthetic import load_dataset
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS = {
+    "manual": os.path.join(BASE_DIR, "manual.py"),
+    "dui": os.path.join(BASE_DIR, "dui.py"),
+    "batch": os.path.join(BASE_DIR, "ui_heart-disease.py"),
+}
+DEFAULT_CSV = os.path.join(BASE_DIR, "test.csv")
+
+# Form widget label prefix -> feature, shared by manual.py and dui.py.
+FORM_FIELDS = {
+    "Age": "age", "Sex": "sex", "Chest Pain": "cp", "Resting Blood": "trestbps",
+    "Serum": "chol", "Fasting": "fbs", "Resting ECG": "restecg", "Max Heart": "thalach",
+    "Exercise": "exang", "ST Depression": "oldpeak", "Slope": "slope",
+    "Number of Major": "ca", "Thalassemia": "thal",
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mib(pid):
+    """
+    Resident set size of process ``pid`` in MiB, or None where /proc is unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def scrape_metrics(url):
+    """
+    ``{series: value}`` from a Prometheus text endpoint ({} if it is unreachable).
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            text = response.read().decode("utf-8")
+    except OSError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            values[series] = float(value)
+    return values
+
+
+class AppServer:
+    """
+    A ``streamlit run`` process for one app, with metrics on a side port.
+    """
+
+    def __init__(self, app_path, startup_timeout=60.0):
+        self.port = _free_port()
+        self.metrics_port = _free_port()
+        env = dict(os.environ, HEART_METRICS="1", HEART_METRICS_PORT=str(self.metrics_port))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", app_path,
+             "--server.headless", "true", "--server.port", str(self.port),
+             "--server.address", "127.0.0.1", "--server.fileWatcherType", "none",
+             "--server.enableXsrfProtection", "false", "--browser.gatherUsageStats", "false"],
+            cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.metrics_url = f"http://127.0.0.1:{self.metrics_port}/metrics"
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"streamlit exited with status {self.process.returncode}")
+            try:
+                urllib.request.urlopen(f"{self.base_url}/_stcore/health", timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError(f"streamlit did not become healthy within {startup_timeout}s")
+
+    @property
+    def rss_mib(self):
+        return rss_mib(self.process.pid)
+
+    def metrics(self):
+        return scrape_metrics(self.metrics_url)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class Session:
+    """
+    One simulated browser tab: a websocket to the app plus its widget state.
+    """
+
+    def __init__(self, server, app, rows, csv, timeout, rng):
+        self.server = server
+        self.app = app
+        self.rows = rows
+        self.csv = csv
+        self.timeout = timeout
+        self.rng = rng
+        self.ws = None
+        self.session_id = None
+        self.widgets = {}     # label -> (element type, proto, fragment id)
+        self.values = {}      # widget id -> WidgetState sent with every rerun
+        self.latencies = []
+        self.errors = 0
+        self.step = 0
+
+    async def connect(self):
+        try:
+            import websockets
+        except ImportError:
+            raise ImportError("loadtest.py needs the websockets package (pip install -r requirements.txt)") from None
+
+        url = self.server.base_url.replace("http://", "ws://") + "/_stcore/stream"
+        self.ws = await websockets.connect(url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, triggers=(), fragment_id=""):
+        """
+        Send a rerun with every stored widget value plus ``triggers``; wait for it to finish.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.fragment_id = fragment_id
+        for state in list(self.values.values()) + list(triggers):
+            msg.rerun_script.widget_states.widgets.add().CopyFrom(state)
+
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        await asyncio.wait_for(self._read_until_finished(), self.timeout)
+        self.latencies.append(time.perf_counter() - start)
+
+    async def _read_until_finished(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await self.ws.recv())
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.session_id = msg.new_session.initialize.session_id
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._record_element(msg.delta.new_element, msg.delta.fragment_id)
+            elif kind == "script_finished":
+                return
+
+    async def _request(self, msg_kind, fill):
+        """
+        Send a non-rerun BackMsg and return the matching ForwardMsg payload.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        fill(getattr(msg, msg_kind))
+        await self.ws.send(msg.SerializeToString())
+        reply_kind = msg_kind.replace("_request", "_response")
+        while True:
+            reply = ForwardMsg()
+            reply.ParseFromString(await asyncio.wait_for(self.ws.recv(), self.timeout))
+            if reply.WhichOneof("type") == reply_kind:
+                return getattr(reply, reply_kind)
+
+    def _record_element(self, element, fragment_id):
+        kind = element.WhichOneof("type")
+        if kind == "exception" or (kind == "alert" and element.alert.format == element.alert.ERROR):
+            self.errors += 1
+            return
+        proto = getattr(element, kind)
+        label = getattr(proto, "label", None)
+        if label and getattr(proto, "id", ""):
+            self.widgets[label] = (kind, proto, fragment_id)
+
+    def widget(self, prefix):
+        for label, widget in self.widgets.items():
+            if label.startswith(prefix):
+                return widget
+        raise LookupError(f"{self.app}: no widget labelled {prefix!r}")
+
+    def set_value(self, prefix, value):
+        """
+        Store a new value for the widget whose label starts with ``prefix``.
+        """
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        kind, proto, fragment_id = self.widget(prefix)
+        state = WidgetState(id=proto.id)
+        if kind == "number_input":
+            state.double_value = float(value)
+        elif kind == "selectbox":
+            state.string_value = str(value)
+        elif kind == "checkbox":
+            state.bool_value = bool(value)
+        else:
+            raise TypeError(f"{self.app}: cannot set a {kind} widget")
+        self.values[proto.id] = state
+        return fragment_id
+
+    def click(self, prefix):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        _, proto, fragment_id = self.widget(prefix)
+        return WidgetState(id=proto.id, trigger_value=True), fragment_id
+
+    async def open(self):
+        await self.connect()
+        await self.rerun()
+        if self.app == "batch":
+            await self.upload(self.csv)
+
+    async def upload(self, path):
+        """
+        Upload ``path`` through the file uploader the way the browser does, then rerun.
+        """
+        from streamlit.proto.Common_pb2 import FileUploaderState
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        name = os.path.basename(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        request_id = uuid.uuid4().hex
+
+        def fill(request):
+            request.request_id = request_id
+            request.session_id = self.session_id
+            request.file_names.append(name)
+
+        response = await self._request("file_urls_request", fill)
+        urls = response.file_urls[0]
+        upload_url = urls.upload_url if urls.upload_url.startswith("http") else self.server.base_url + urls.upload_url
+        await asyncio.to_thread(_put_multipart, upload_url, name, data)
+
+        _, proto, _ = self.widget("📂 Upload CSV")
+        state = WidgetState(id=proto.id)
+        uploader = FileUploaderState()
+        info = uploader.uploaded_file_info.add()
+        info.name, info.size, info.file_id = name, len(data), urls.file_id
+        info.file_urls.CopyFrom(urls)
+        state.file_uploader_state_value.CopyFrom(uploader)
+        self.values[proto.id] = state
+        await self.rerun()
+
+    async def interact(self):
+        """
+        Replay the next interaction of this app's scenario.
+        """
+        self.step += 1
+        if self.app == "batch":
+            _, proto, _ = self.widget("Comparison mode")
+            current = self.values.get(proto.id)
+            fragment_id = self.set_value("Comparison mode", not (current and current.bool_value))
+            await self.rerun(fragment_id=fragment_id)
+        elif self.app == "dui" and self.step % 3 == 0:
+            _, proto, _ = self.widget("Select Your State")
+            fragment_id = self.set_value("Select Your State", self.rng.choice(list(proto.options)))
+            await self.rerun(fragment_id=fragment_id)
+        else:
+            row = self.rows[self.rng.integers(len(self.rows))]
+            for prefix, feature in FORM_FIELDS.items():
+                self.set_value(prefix, row[feature])
+            trigger, fragment_id = self.click("🔍 Predict")
+            await self.rerun([trigger], fragment_id=fragment_id)
+
+
+def _put_multipart(url, name, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+        f"Content-Type: text/csv\r\n\r\n"
+    ).encode("utf-8") + data + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    request = urllib.request.Request(url, data=body, method="PUT", headers={
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+    })
+    urllib.request.urlopen(request, timeout=60).close()
+
+
+async def _interact(session, args):
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    done = 0
+    while (time.perf_counter() < deadline) if deadline else (done < args.interactions):
+        await session.interact()
+        done += 1
+        if args.think_time:
+            await asyncio.sleep(args.think_time)
+
+
+async def _run_sessions(sessions, args, server, rss_samples):
+    """
+    Open every session, then run their interactions concurrently.
+
+    Returns ``(interaction_seconds, failures)``; a session that fails to open
+    does not take part in the interaction phase.
+    """
+    opened = await asyncio.gather(*(s.open() for s in sessions), return_exceptions=True)
+    failures = [repr(r) for r in opened if isinstance(r, BaseException)]
+    active = [s for s, r in zip(sessions, opened) if not isinstance(r, BaseException)]
+
+    async def sampler(start):
+        while True:
+            rss_samples.append((time.perf_counter() - start, server.rss_mib))
+            await asyncio.sleep(args.sample_interval)
+
+    start = time.perf_counter()
+    sampling = asyncio.create_task(sampler(start))
+    results = await asyncio.gather(*(_interact(s, args) for s in active), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    sampling.cancel()
+    for session in sessions:
+        await session.close()
+    return elapsed, failures + [repr(r) for r in results if isinstance(r, BaseException)]
+
+
+def run_level(server, app, n_sessions, args, rows):
+    """
+    Run ``n_sessions`` concurrent sessions of ``app`` and summarize them.
+    """
+    sessions = [
+        Session(server, app, rows, args.csv, args.timeout, np.random.default_rng(args.seed + i))
+        for i in range(n_sessions)
+    ]
+    before = server.metrics()
+    rss_before = server.rss_mib
+    rss_samples = []
+    elapsed, failures = asyncio.run(_run_sessions(sessions, args, server, rss_samples))
+    after = server.metrics()
+    rss_after = server.rss_mib
+
+    def delta(series):
+        return after.get(series, 0.0) - before.get(series, 0.0)
+
+    n_open = 2 if app == "batch" else 1
+    opens = [t for s in sessions for t in s.latencies[:n_open]]
+    interactions = [t for s in sessions for t in s.latencies[n_open:]]
+    hits = delta('heart_cache_lookups_total{result="hit"}')
+    misses = delta('heart_cache_lookups_total{result="miss"}')
+    samples = [(t, rss) for t, rss in rss_samples if rss is not None]
+
+    result = {
+        "sessions": n_sessions,
+        "interactions": len(interactions),
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(interactions) / elapsed if elapsed else 0.0,
+        "open_latency": summarize_ms(opens) if opens else None,
+        "interaction_latency": summarize_ms(interactions) if interactions else None,
+        "errors": sum(s.errors for s in sessions),
+        "failures": failures,
+        "memory": {
+            "rss_before_mib": rss_before,
+            "rss_after_mib": rss_after,
+            "growth_per_session_mib": ((rss_after - rss_before) / n_sessions
+                                       if rss_before is not None and rss_after is not None else None),
+            # Soak-mode leak indicator: least-squares slope of the RSS samples.
+            "rss_slope_mib_per_min": (float(np.polyfit(*np.array(samples).T, 1)[0]) * 60
+                                      if len(samples) >= 3 else None),
+        },
+        "cache": {
+            "artifact_loads": int(delta('heart_stage_seconds_count{stage="load_artifacts"}')),
+            "prediction_cache": {
+                "hits": int(hits),
+                "misses": int(misses),
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+            },
+        },
+    }
+    if interactions:
+        result["interaction_latency"]["p95_ms"] = float(np.percentile(np.asarray(interactions) * 1e3, 95))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load and soak test the Streamlit apps with simulated sessions.")
+    parser.add_argument("--apps", nargs="+", choices=list(APPS), default=list(APPS))
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16],
+                        help="concurrency levels to run, one after another")
+    parser.add_argument("--interactions", type=int, default=10, help="interactions per session")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="soak mode: interact for this many seconds instead of --interactions")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause between interactions (s)")
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="CSV uploaded by batch-tester sessions")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-rerun timeout (s)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="RSS sampling period (s)")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rows = load_dataset().to_dict("records")
+    results = {
+        "environment": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "cpu_count": os.cpu_count(),
+            "csv": os.path.abspath(args.csv),
+            "interactions": args.interactions,
+            "duration_s": args.duration,
+            "think_time_s": args.think_time,
+        },
+        "results": {},
+    }
+    for app in args.apps:
+        server = AppServer(APPS[app])
+        try:
+            # Keyed by concurrency so --baseline compares like with like.
+            results["results"][app] = {}
+            for n_sessions in args.sessions:
+                level = run_level(server, app, n_sessions, args, rows)
+                results["results"][app][f"sessions_{n_sessions}"] = level
+                latency = level["interaction_latency"] or {}
+                print(f"{app} x{n_sessions}: {level['throughput_per_s']:.1f} interactions/s, "
+                      f"p50 {latency.get('p50_ms', float('nan')):.1f} ms, "
+                      f"p99 {latency.get('p99_ms', float('nan')):.1f} ms, {level['errors']} errors, "
+                      f"{len(level['failures'])} failed sessions, artifact loads {level['cache']['artifact_loads']}",
+                      file=sys.stderr)
+        finally:
+            server.close()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparison against {args.baseline} (ratio = current / baseline):")
+        for path, old, new, ratio in compare(results["results"], baseline.get("results", {})):
+            print(f"  {path:<60} {old:>14.4f} -> {new:>14.4f}  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    main()
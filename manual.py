@@ -1,6 +1,11 @@
+import os
+
 import streamlit as st
-import joblib
-import pandas as pd
+
+from artifacts import artifact_stamp, open_artifact, serving_index
+from metrics import METRICS, export_from_env, render_debug_panel, serve_from_env
+from prediction_cache import CachedPredictor, PredictionCache
+from service import predict_remote
 
 # PAGE CONFIG
 st.set_page_config(
@@ -10,15 +15,34 @@ st.set_page_config(
 )
 
 # LOAD MODEL AND SCALER
+BASE_DIR = os.path.dirname(__file__)
+ARTIFACT_PATH = os.path.join(BASE_DIR, "knn_model.mmap")
+
+# Keyed on the artifact's file stamp, so a version published by
+# update_model.py is picked up on the next rerun without a restart.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_artifacts(stamp):
+    with METRICS.timer("load_artifacts"):
+        return open_artifact(ARTIFACT_PATH, index=serving_index())
+
+# One prediction cache shared by every session of this server process
 @st.cache_resource(show_spinner=False)
-def load_artifacts():
-    import os
-    BASE_DIR = os.path.dirname(__file__)
-    model = joblib.load(os.path.join(BASE_DIR, "knn_model.pkl"))
-    scaler = joblib.load(os.path.join(BASE_DIR, "scaler.pkl"))
-    return model, scaler
+def load_prediction_cache():
+    return PredictionCache(maxsize=10_000)
+
+# Set HEART_SERVICE_URL (e.g. http://127.0.0.1:8600) to send predictions to a
+# running service.py instead of loading the model in this process.
+SERVICE_URL = os.environ.get("HEART_SERVICE_URL")
 
-knn_model, scaler = load_artifacts()
+
+# Resolved on every run that predicts, fragment reruns included: those do not
+# re-execute this module, so a module-level predictor would stay on the
+# version that was current when the page was first loaded.
+def current_predictor():
+    return CachedPredictor(load_artifacts(artifact_stamp(ARTIFACT_PATH)), load_prediction_cache())
+
+# Optional /metrics endpoint (HEART_METRICS_PORT), started once per process
+serve_from_env()
 
 # STYLING + ANIMATION
 st.markdown("""
@@ -103,14 +127,29 @@ st.title("❤️ Heart Disease Model prediction using KNN")
 st.markdown("Enter  values and get real-time prediction.")
 
 # MANUAL INPUT FORM
-feature_names = [
-    "age", "sex", "cp", "trestbps", "chol", "fbs",
-    "restecg", "thalach", "exang", "oldpeak", "slope", "ca", "thal"
-]
-
-with st.container():
-    st.markdown('<div class="manual-input-container">', unsafe_allow_html=True)
-
+# A fragment: submitting the form reruns only this section, not the page
+# (CSS, title, ...). The last result lives in session state, so it is
+# redrawn without recomputation on full-page reruns.
+def render_prediction(result):
+    prediction, proba = result
+    prob_no_disease = proba[0] * 100
+    prob_disease = proba[1] * 100
+
+    with METRICS.timer("render"):
+        if prediction == 1:
+            st.markdown(
+                f'<div class="result-error"><span class="result-icon">🚨</span> '
+                f'**Prediction: Likely Heart Disease** ({prob_disease:.2f}%)</div>',
+                unsafe_allow_html=True)
+        else:
+            st.markdown(
+                f'<div class="result-success"><span class="result-icon">✅</span> '
+                f'**Prediction: No Heart Disease** ({prob_no_disease:.2f}%)</div>',
+                unsafe_allow_html=True)
+
+
+@st.fragment
+def prediction_form():
     with st.form("manual_input_form"):
         st.subheader("🧮 Input")
 
@@ -136,30 +175,31 @@ with st.container():
         submitted = st.form_submit_button("🔍 Predict")
 
         if submitted:
-            input_data = [[
+            input_data = [
                 age, sex, cp, trestbps, chol, fbs, restecg,
                 thalach, exang, oldpeak, slope, ca, thal
-            ]]
+            ]
             try:
-                input_df = pd.DataFrame(input_data, columns=feature_names)
-                input_scaled = scaler.transform(input_df)
-                prediction = knn_model.predict(input_scaled)[0]
-                proba = knn_model.predict_proba(input_scaled)[0]
-                prob_no_disease = proba[0] * 100
-                prob_disease = proba[1] * 100
-
-                if prediction == 1:
-                    st.markdown(
-                        f'<div class="result-error"><span class="result-icon">🚨</span> '
-                        f'**Prediction: Likely Heart Disease** ({prob_disease:.2f}%)</div>',
-                        unsafe_allow_html=True)
-                else:
-                    st.markdown(
-                        f'<div class="result-success"><span class="result-icon">✅</span> '
-                        f'**Prediction: No Heart Disease** ({prob_no_disease:.2f}%)</div>',
-                        unsafe_allow_html=True)
-
+                with METRICS.timer("predict"):
+                    if SERVICE_URL:
+                        prediction, proba, _ = predict_remote(SERVICE_URL, input_data)
+                    else:
+                        prediction, proba, _ = current_predictor().predict_one(input_data)
+                st.session_state["last_prediction"] = (int(prediction), [float(p) for p in proba])
             except Exception as e:
+                METRICS.inc("heart_errors_total", stage="predict")
+                st.session_state.pop("last_prediction", None)
                 st.error(f"⚠️ Prediction error: {e}")
 
+        if "last_prediction" in st.session_state:
+            render_prediction(st.session_state["last_prediction"])
+
+
+with st.container():
+    st.markdown('<div class="manual-input-container">', unsafe_allow_html=True)
+    prediction_form()
     st.markdown('</div>', unsafe_allow_html=True)
+
+# DEBUG PANEL (?debug=1) + OPTIONAL METRICS FILE DUMP
+render_debug_panel()
+export_from_env()
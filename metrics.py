@@ -0,0 +1,319 @@
+"""
+Hot-path latency instrumentation with Prometheus text export.
+
+``METRICS`` is the process-wide registry used by the predictor, the Streamlit
+apps and service.py:
+
+- ``METRICS.timer("neighbor_search")`` times a stage into the
+  ``heart_stage_seconds`` histogram;
+- ``METRICS.inc("heart_errors_total", stage="predict")`` counts events, e.g.
+  the ``except Exception`` branches of the apps;
+- ``METRICS.observe("heart_batch_rows", n)`` records a value into a histogram.
+
+Instrumentation is off unless ``HEART_METRICS=1`` (or one of the export
+variables below) is set. When off, ``timer`` returns a shared no-op context
+manager and ``inc``/``observe`` return after one attribute check, so the
+instrumented hot paths cost a few hundred nanoseconds per call.
+
+Export:
+
+- ``METRICS.render()`` gives the Prometheus text exposition format; service.py
+  serves it on ``GET /metrics``.
+- ``HEART_METRICS_PORT=9464`` starts a small ``/metrics`` HTTP endpoint inside
+  a Streamlit process (``serve_from_env``). It listens on 127.0.0.1 only;
+  set ``HEART_METRICS_HOST=0.0.0.0`` to expose it to a remote scraper.
+- ``HEART_METRICS_FILE=/var/lib/node_exporter/heart.prom`` makes the apps dump
+  the registry there after every run (node-exporter textfile collector).
+- ``render_debug_panel()`` adds a sidebar table to the apps when the page is
+  opened with ``?debug=1``.
+"""
+import bisect
+import contextlib
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; spans single-row predictions (~50 us) to large batch uploads.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 10_000, 100_000, 1_000_000)
+
+HELP = {
+    "heart_stage_seconds": "Wall time per pipeline stage.",
+    "heart_batch_rows": "Rows per predict() call.",
+    "heart_predictions_total": "Rows scored.",
+    "heart_errors_total": "Errors caught by the apps and service, by stage.",
+    "heart_requests_total": "Service HTTP requests by path and status.",
+    "heart_cache_lookups_total": "Prediction cache lookups by result.",
+    "heart_index_builds_total": "Neighbor indexes built by KNNPredictor.use_index, by kind.",
+}
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus semantics).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the ``q`` quantile (inf past the last bucket).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _Timer:
+    __slots__ = ("metrics", "labels", "start")
+
+    def __init__(self, metrics, labels):
+        self.metrics = metrics
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe("heart_stage_seconds", self.labels, time.perf_counter() - self.start, LATENCY_BUCKETS)
+        return False
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        enabled = any(environ.get(name) for name in ("HEART_METRICS_FILE", "HEART_METRICS_PORT"))
+        enabled = enabled or environ.get("HEART_METRICS", "").lower() in ("1", "true", "yes", "on")
+        return cls(enabled)
+
+    def timer(self, stage, **labels):
+        """
+        Context manager timing ``stage`` into ``heart_stage_seconds``.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        labels["stage"] = stage
+        return _Timer(self, _label_key(labels))
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        self._observe(name, _label_key(labels), value, buckets)
+
+    def _observe(self, name, key, value, buckets):
+        with self._lock:
+            histogram = self._histograms.get((name, key))
+            if histogram is None:
+                histogram = self._histograms[(name, key)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def summary(self):
+        """
+        One dict per series (counters and histograms) for a debug table.
+        """
+        rows = []
+        with self._lock:
+            for (name, key), value in sorted(self._counters.items()):
+                rows.append({"metric": name + _format_labels(key), "count": value})
+            for (name, key), h in sorted(self._histograms.items()):
+                rows.append({
+                    "metric": name + _format_labels(key),
+                    "count": h.count,
+                    "mean": h.sum / h.count if h.count else None,
+                    "p50<=": h.quantile(0.5),
+                    "p99<=": h.quantile(0.99),
+                    "sum": h.sum,
+                })
+        return rows
+
+    def render(self):
+        """
+        The registry in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (name, key, h.buckets, list(h.counts), h.sum, h.count)
+                for (name, key), h in self._histograms.items()
+            )
+
+        seen = set()
+        for (name, key), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for name, key, buckets, counts, total, count in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, n in zip(buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(float(total))}")
+            lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """
+        Atomically write ``render()`` to ``path`` (textfile-collector safe).
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".prom")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+METRICS = Metrics.from_env()
+
+
+def start_http_server(port, host="127.0.0.1", metrics=METRICS):
+    """
+    Serve ``metrics.render()`` on ``GET /metrics`` from a daemon thread.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_from_env(environ=os.environ, metrics=METRICS):
+    """
+    Start the ``/metrics`` endpoint on ``HEART_METRICS_PORT`` once per process.
+
+    Bound to loopback unless ``HEART_METRICS_HOST`` names another interface.
+    """
+    global _server
+    port = environ.get("HEART_METRICS_PORT")
+    if not port or not metrics.enabled:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = start_http_server(port, environ.get("HEART_METRICS_HOST", "127.0.0.1"), metrics)
+    return _server
+
+
+def export_from_env(environ=os.environ, metrics=METRICS):
+    """
+    Dump to ``HEART_METRICS_FILE`` if set; called by the apps at the end of a run.
+    """
+    path = environ.get("HEART_METRICS_FILE")
+    if path and metrics.enabled:
+        metrics.dump(path)
+
+
+def render_debug_panel(metrics=METRICS):
+    """
+    Sidebar table of the registry for a Streamlit app.
+
+    Shown when instrumentation is on and the page is opened with ``?debug=1``
+    (or ``HEART_DEBUG=1`` is set).
+    """
+    if not metrics.enabled:
+        return
+    import streamlit as st
+
+    if st.query_params.get("debug") != "1" and not os.environ.get("HEART_DEBUG"):
+        return
+    rows = metrics.summary()
+    for row in rows:
+        for field in ("mean", "p50<=", "p99<=", "sum"):
+            if row.get(field) is not None and row["metric"].startswith("heart_stage_seconds"):
+                row[field] = row[field] * 1e3
+    with st.sidebar.expander("⏱️ Debug: stage latency (ms) and counters", expanded=True):
+        st.dataframe(rows, hide_index=True)
+        st.download_button("Download metrics (Prometheus text)", metrics.render(), file_name="heart_metrics.prom")
@@ -0,0 +1,578 @@
+"""
+Neighbor-index backends for the KNN reference set.
+
+Every index is built over the *scaled* training matrix (the same matrix the
+notebook fits ``KNeighborsClassifier`` on) and answers ``query(queries, k)``
+with ``(distances, indices)`` sorted closest first, exactly like
+``KNeighborsClassifier.kneighbors``:
+
+- ``brute``: exhaustive, blocked NumPy search (the reference for recall).
+- ``kd_tree`` / ``ball_tree``: exact scikit-learn trees, best for the 13
+  low-dimensional Cleveland features.
+- ``categorical``: exact search partitioned by the categorical codes. Rows
+  are bucketed by their (sex, cp, fbs, ..., thal) signature, and a bucket is
+  only scanned while its distance lower bound can still beat the current k-th
+  neighbor.
+- ``compact``: exact search that scans a float32 copy of the reference set
+  (or int8/int16 codes for the categorical columns plus float32 vitals) and
+  re-ranks the surviving candidates in float64.
+- ``ivf``: approximate inverted-file index. The reference set is clustered
+  with k-means; a query only scans the ``n_probe`` closest clusters, which is
+  the recall/latency knob.
+
+Run ``python neighbor_index.py --kind ivf --reference-size 1000000`` to
+measure recall and latency against brute force on a synthetic reference set.
+The report says whether the neighbor lists are identical to brute force, and
+the command fails if they are not for an exact index.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from predictor import (
+    CATEGORICAL_FEATURES, DEFAULT_BLOCK_ELEMENTS, FEATURE_NAMES, minkowski_distances, top_k,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def exact_scores(q, rows, p=2):
+    """
+    ``distance ** p`` from the query ``q`` to each of ``rows``, in float64.
+
+    Features are accumulated one at a time, so a row's score does not depend on
+    which other rows it is computed with (a BLAS product changes its summation
+    order with the operand shapes).
+    """
+    diff = rows - q
+    scores = np.zeros(diff.shape[0], dtype=np.float64)
+    for j in range(diff.shape[1]):
+        scores += diff[:, j] * diff[:, j] if p == 2 else np.abs(diff[:, j]) ** p
+    return scores
+
+
+def rerank(q, data, candidates, k, p=2):
+    """
+    The ``k`` nearest of ``candidates`` (row indices into ``data``) to ``q`` as
+    ``(distances, indices)``, closest first.
+
+    Every exact index ranks its final candidates here, by ``exact_scores`` with
+    ties going to the lower row index. Two exact indexes whose candidates
+    include the true k nearest rows therefore return identical neighbor lists.
+    """
+    candidates = np.asarray(candidates, dtype=np.intp)
+    scores = exact_scores(q, data[candidates], p)
+    keep = np.lexsort((candidates, scores))[:k]
+    distances = np.sqrt(scores[keep]) if p == 2 else scores[keep] ** (1.0 / p)
+    return distances, candidates[keep]
+
+
+def _rel_error(n_features, dtype=np.float64):
+    # Worst-case rounding error of a ``||x||^2 - 2 q.x`` score, per unit of ||q||^2 + ||x||^2.
+    return 2.0 * (n_features + 4) * float(np.finfo(dtype).eps)
+
+
+class BruteForceIndex:
+    """
+    Exact exhaustive search, processed in memory-bounded query blocks.
+
+    Every row is scored with one matrix product per block; the rows within
+    rounding error of the k-th score are re-ranked with ``rerank``.
+    """
+    exact = True
+
+    def __init__(self, data, p=2, block_elements=DEFAULT_BLOCK_ELEMENTS):
+        self.data = np.asarray(data, dtype=np.float64)
+        self.p = p
+        self.block_elements = int(block_elements)
+        self._rel_error = _rel_error(self.data.shape[1])
+        if p == 2:
+            self._sq_norms = np.einsum("ij,ij->i", self.data, self.data)
+            self._max_sq_norm = float(self._sq_norms.max())
+
+    def query(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float64)
+        n_queries = queries.shape[0]
+        distances = np.empty((n_queries, k), dtype=np.float64)
+        indices = np.empty((n_queries, k), dtype=np.intp)
+
+        per_query = self.data.shape[0] * (1 if self.p == 2 else self.data.shape[1])
+        step = max(1, self.block_elements // per_query)
+        for start in range(0, n_queries, step):
+            q = queries[start:start + step]
+            if self.p == 2:
+                scores = self._sq_norms - 2.0 * (q @ self.data.T)
+                kth = np.partition(scores, k - 1, axis=1)[:, k - 1]
+                margin = 2.0 * self._rel_error * (np.einsum("ij,ij->i", q, q) + self._max_sq_norm + 1.0)
+            else:
+                scores = np.sum(np.abs(q[:, None, :] - self.data[None, :, :]) ** self.p, axis=2)
+                kth = np.partition(scores, k - 1, axis=1)[:, k - 1]
+                margin = 2.0 * self._rel_error * (kth + 1.0)
+            for row in range(q.shape[0]):
+                candidates = np.flatnonzero(scores[row] <= kth[row] + margin[row])
+                distances[start + row], indices[start + row] = rerank(q[row], self.data, candidates, k, self.p)
+        return distances, indices
+
+
+class TreeIndex:
+    """
+    Exact KD-tree or ball-tree search backed by scikit-learn.
+
+    scikit-learn orders equal distances its own way, so each query fetches
+    ``k + 1`` neighbors and re-ranks them with ``rerank``, like
+    ``BruteForceIndex``. Only when the extra neighbor is within rounding
+    error of the k-th one, i.e. the k-th place is tied, does ``query_radius``
+    gather every tied row.
+    """
+    exact = True
+
+    def __init__(self, data, kind="kd_tree", p=2, leaf_size=30):
+        from sklearn.neighbors import BallTree, KDTree
+
+        trees = {"kd_tree": KDTree, "ball_tree": BallTree}
+        if kind not in trees:
+            raise ValueError(f"Unknown tree kind: {kind!r}")
+        self.data = np.asarray(data, dtype=np.float64)
+        self.kind = kind
+        self.p = p
+        self.tree = trees[kind](self.data, leaf_size=leaf_size, metric="minkowski", p=p)
+
+    def query(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float64)
+        n_fetch = min(k + 1, self.data.shape[0])
+        fetched_distances, fetched = self.tree.query(queries, k=n_fetch)
+        radius = fetched_distances[:, k - 1] * (1.0 + 1e-9) + 1e-12
+        tied = fetched_distances[:, -1] <= radius if n_fetch > k else np.zeros(len(queries), dtype=bool)
+
+        distances = np.empty((len(queries), k), dtype=np.float64)
+        indices = np.empty((len(queries), k), dtype=np.intp)
+        for row in range(len(queries)):
+            candidates = fetched[row]
+            if tied[row]:
+                candidates = self.tree.query_radius(queries[row:row + 1], radius[row:row + 1])[0]
+            distances[row], indices[row] = rerank(queries[row], self.data, candidates, k, self.p)
+        return distances, indices
+
+
+def signature_codes(data, columns):
+    """
+    Distinct value combinations of ``data[:, columns]`` and each row's code into them.
+    """
+    # Mixed-radix key over per-column codes; much faster than np.unique(axis=0).
+    key = np.zeros(data.shape[0], dtype=np.int64)
+    for column in columns:
+        values, codes = np.unique(data[:, column], return_inverse=True)
+        key = key * len(values) + codes.reshape(-1)
+    _, first, assignment = np.unique(key, return_index=True, return_inverse=True)
+    return data[first][:, columns], assignment.reshape(-1)
+
+
+class CategoricalIndex:
+    """
+    Exact search over buckets of rows sharing one categorical signature.
+
+    After scaling, the low-cardinality codes add large fixed steps to every
+    distance, so most buckets are far from any given query. Each bucket keeps
+    the per-feature bounding box of its rows, which is constant on the
+    categorical columns and gives a lower bound that includes their exact
+    distance contribution. Buckets are scanned in lower-bound order until the
+    next bound exceeds the current k-th distance. The rows within rounding
+    error of the k-th score are re-ranked with ``rerank``, like
+    ``BruteForceIndex``, so the neighbor lists are identical to brute force.
+
+    ``columns`` are the categorical column positions (default: the
+    ``CATEGORICAL_FEATURES`` of the Cleveland schema).
+    """
+    exact = True
+
+    def __init__(self, data, columns=None, p=2, block_elements=DEFAULT_BLOCK_ELEMENTS):
+        data = np.asarray(data, dtype=np.float64)
+        if columns is None:
+            columns = [FEATURE_NAMES.index(name) for name in CATEGORICAL_FEATURES]
+        self.columns = np.asarray(columns, dtype=np.intp)
+        self.p = p
+        self.block_elements = int(block_elements)
+
+        self.signatures, assignment = signature_codes(data, self.columns)
+        self._order = np.argsort(assignment, kind="stable")
+        self._offsets = np.searchsorted(assignment[self._order], np.arange(len(self.signatures) + 1))
+        self.data = data
+        self._grouped = data[self._order]
+        starts = self._offsets[:-1]
+        self._lower = np.minimum.reduceat(self._grouped, starts, axis=0)
+        self._upper = np.maximum.reduceat(self._grouped, starts, axis=0)
+        if p == 2:
+            self._sq_norms = np.einsum("ij,ij->i", self._grouped, self._grouped)
+            self._max_sq_norm = float(self._sq_norms.max())
+
+    @property
+    def n_buckets(self):
+        return len(self.signatures)
+
+    def lower_bounds(self, queries):
+        """
+        Per-bucket lower bounds on ``distance ** p`` for each query, (n, n_buckets).
+        """
+        below = np.maximum(self._lower[None, :, :] - queries[:, None, :], 0.0)
+        above = np.maximum(queries[:, None, :] - self._upper[None, :, :], 0.0)
+        return np.sum((below + above) ** self.p, axis=2)
+
+    def query(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float64)
+        n_queries = queries.shape[0]
+        distances = np.empty((n_queries, k), dtype=np.float64)
+        indices = np.empty((n_queries, k), dtype=np.intp)
+
+        step = max(1, self.block_elements // (self.n_buckets * queries.shape[1]))
+        for start in range(0, n_queries, step):
+            block = queries[start:start + step]
+            bounds = self.lower_bounds(block)
+            for row in range(block.shape[0]):
+                candidates = self._candidates(block[row], bounds[row], k)
+                distances[start + row], indices[start + row] = rerank(block[row], self.data, candidates, k, self.p)
+        return distances, indices
+
+    def _candidates(self, q, bounds, k):
+        if self.p == 2:
+            # Scores are ||x||^2 - 2 q.x, i.e. distance^2 - ||q||^2. The slack
+            # covers the rounding of that folded form when comparing to bounds
+            # and to the k-th score.
+            offset = float(q @ q)
+            slack = 1e-9 * (offset + self._max_sq_norm + 1.0)
+        else:
+            offset = 0.0
+            slack = 0.0
+
+        best_scores = np.empty(0, dtype=np.float64)
+        best_rows = np.empty(0, dtype=np.intp)
+        for bucket in np.argsort(bounds, kind="stable"):
+            if best_rows.size >= k and bounds[bucket] - 2.0 * slack > best_scores[k - 1] + offset:
+                break
+            lo, hi = self._offsets[bucket], self._offsets[bucket + 1]
+            rows = self._grouped[lo:hi]
+            if self.p == 2:
+                scores = self._sq_norms[lo:hi] - 2.0 * (rows @ q)
+            else:
+                scores = exact_scores(q, rows, self.p)
+            scores = np.concatenate([best_scores, scores])
+            candidates = np.concatenate([best_rows, self._order[lo:hi]])
+            order = np.argsort(scores, kind="stable")
+            if order.size > k:
+                order = order[scores[order] <= scores[order[k - 1]] + 2.0 * slack]
+            best_scores, best_rows = scores[order], candidates[order]
+        return best_rows
+
+
+COMPACT_STORAGE = ("float32", "codes")
+
+
+class CompactIndex:
+    """
+    Exact Euclidean search over a compact copy of the reference set.
+
+    ``storage="float32"`` scans a float32 copy of every column (half the bytes).
+    ``storage="codes"`` replaces the categorical columns with one int8/int16
+    code per row, naming its categorical signature, and keeps the continuous
+    vitals as float32. The categorical part of a distance then comes from a
+    per-query lookup table over the signatures.
+
+    The approximate float32 scores have a known worst-case rounding error. A
+    query keeps every row whose approximate score is within twice that bound
+    of its approximate k-th score, which always includes the true k nearest
+    rows. Those candidates are re-ranked in float64 with ``rerank``, like
+    ``BruteForceIndex``, so the neighbor lists are identical to brute force.
+    Only candidate rows of the float64 matrix are read, so a memory-mapped
+    reference set stays mostly cold.
+
+    The float64 matrix is borrowed, not copied, when ``data`` already is a
+    float64 array: pass the artifact's memory map (``predictor.train_scaled``)
+    for the compact layout to actually save memory. Any other input is
+    converted into a float64 copy owned by the index, and ``nbytes`` counts it.
+    """
+    exact = True
+
+    def __init__(self, data, storage="float32", columns=None, p=2, block_elements=DEFAULT_BLOCK_ELEMENTS):
+        if p != 2:
+            raise ValueError("CompactIndex supports Euclidean distance (p=2) only")
+        if storage not in COMPACT_STORAGE:
+            raise ValueError(f"Unknown storage {storage!r}; choose from {COMPACT_STORAGE}")
+        self.data = np.asarray(data, dtype=np.float64)
+        self.owns_data = not (isinstance(data, np.ndarray) and np.may_share_memory(self.data, data))
+        self.p = p
+        self.storage = storage
+        self.block_elements = int(block_elements)
+        n_features = self.data.shape[1]
+
+        if storage == "codes":
+            if columns is None:
+                columns = [FEATURE_NAMES.index(name) for name in CATEGORICAL_FEATURES]
+            self.columns = np.asarray(columns, dtype=np.intp)
+            # One code per distinct categorical signature, so the categorical
+            # part of a distance is a single table lookup per row.
+            self.signatures, inverse = signature_codes(self.data, self.columns)
+            n_codes = len(self.signatures)
+            dtype = np.int8 if n_codes <= 1 << 7 else np.int16 if n_codes <= 1 << 15 else np.int32
+            self.codes = inverse.astype(dtype)
+        else:
+            self.columns = np.empty(0, dtype=np.intp)
+            self.signatures = None
+            self.codes = None
+        self.dense_columns = np.setdiff1d(np.arange(n_features), self.columns)
+        self.dense = np.ascontiguousarray(self.data[:, self.dense_columns], dtype=np.float32)
+        self._dense_sq_norms = np.einsum("ij,ij->i", self.dense, self.dense)
+
+        sq_norms = np.einsum("ij,ij->i", self.data, self.data)
+        self._max_sq_norm = float(sq_norms.max())
+        self._rel_error = _rel_error(n_features, np.float32)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the index, including its float64 copy of the reference set if it made one.
+        """
+        codes = self.codes.nbytes if self.codes is not None else 0
+        owned = self.data.nbytes if self.owns_data else 0
+        return self.dense.nbytes + self._dense_sq_norms.nbytes + codes + owned
+
+    def approximate_scores(self, queries):
+        """
+        float32 ``distance^2 - ||q_dense||^2`` of every reference row, (n, n_rows).
+        """
+        q = queries[:, self.dense_columns].astype(np.float32)
+        scores = self._dense_sq_norms - 2.0 * (q @ self.dense.T)
+        if self.codes is not None:
+            diff = queries[:, None, self.columns] - self.signatures[None, :, :]
+            table = np.einsum("ijk,ijk->ij", diff, diff).astype(np.float32)
+            for row in range(queries.shape[0]):
+                scores[row] += table[row].take(self.codes)
+        return scores
+
+    def query(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float64)
+        n_queries = queries.shape[0]
+        distances = np.empty((n_queries, k), dtype=np.float64)
+        indices = np.empty((n_queries, k), dtype=np.intp)
+
+        step = max(1, self.block_elements // self.data.shape[0])
+        for start in range(0, n_queries, step):
+            block = queries[start:start + step]
+            scores = self.approximate_scores(block)
+            kth = np.partition(scores, k - 1, axis=1)[:, k - 1].astype(np.float64)
+            bound = self._rel_error * (np.einsum("ij,ij->i", block, block) + self._max_sq_norm + 1.0)
+            for row in range(block.shape[0]):
+                candidates = np.flatnonzero(scores[row] <= kth[row] + 2.0 * bound[row])
+                distances[start + row], indices[start + row] = rerank(block[row], self.data, candidates, k)
+        return distances, indices
+
+
+class IVFIndex:
+    """
+    Approximate inverted-file index over k-means clusters of the reference set.
+
+    ``n_lists`` clusters (default ~sqrt(n)) are trained on a sample of at most
+    ``sample_size`` rows. Reference rows are stored grouped by cluster so each
+    probed list is one contiguous slice. A query scans its ``n_probe`` nearest
+    clusters (more if they hold fewer than ``k`` rows) and ranks the candidates
+    exactly; raising ``n_probe`` trades latency for recall.
+    """
+    exact = False
+
+    def __init__(self, data, n_lists=None, n_probe=8, p=2, n_iter=10,
+                 sample_size=100_000, seed=0):
+        data = np.asarray(data, dtype=np.float64)
+        n_rows = data.shape[0]
+        self.p = p
+        self.n_probe = int(n_probe)
+        self.n_lists = int(n_lists or max(1, round(np.sqrt(n_rows))))
+        self.n_lists = min(self.n_lists, n_rows)
+
+        rng = np.random.default_rng(seed)
+        self.centroids = _kmeans(data, self.n_lists, n_iter, sample_size, rng)
+        assignment = _nearest_centroid(data, self.centroids)
+
+        self._order = np.argsort(assignment, kind="stable")
+        self._offsets = np.searchsorted(assignment[self._order], np.arange(self.n_lists + 1))
+        self.data = data
+        self._grouped = data[self._order]
+
+    def query(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float64)
+        n_queries = queries.shape[0]
+        distances = np.empty((n_queries, k), dtype=np.float64)
+        indices = np.empty((n_queries, k), dtype=np.intp)
+
+        sizes = np.diff(self._offsets)
+        coarse = _sq_distances(queries, self.centroids)
+        probe_order = np.argsort(coarse, axis=1)
+        for row in range(n_queries):
+            lists = probe_order[row]
+            covered = np.cumsum(sizes[lists])
+            n_probe = max(self.n_probe, int(np.searchsorted(covered, k)) + 1)
+            chosen = lists[:n_probe]
+
+            positions = np.concatenate([
+                np.arange(self._offsets[c], self._offsets[c + 1]) for c in chosen
+            ])
+            q = queries[row:row + 1]
+            candidates = self._grouped[positions]
+            d = minkowski_distances(q, candidates[None, :, :], self.p)
+            best = top_k(d, min(k, len(positions)))[0]
+            distances[row] = d[0, best]
+            indices[row] = self._order[positions[best]]
+        return distances, indices
+
+
+def _sq_distances(a, b):
+    sq = np.einsum("ij,ij->i", a, a)[:, None] - 2.0 * (a @ b.T) + np.einsum("ij,ij->i", b, b)
+    return np.maximum(sq, 0.0)
+
+
+def _nearest_centroid(data, centroids):
+    assignment = np.empty(data.shape[0], dtype=np.intp)
+    block_rows = max(1, DEFAULT_BLOCK_ELEMENTS // (4 * centroids.shape[0]))
+    for start in range(0, data.shape[0], block_rows):
+        block = data[start:start + block_rows]
+        assignment[start:start + block_rows] = np.argmin(_sq_distances(block, centroids), axis=1)
+    return assignment
+
+
+def _kmeans(data, n_clusters, n_iter, sample_size, rng):
+    if data.shape[0] > sample_size:
+        data = data[rng.choice(data.shape[0], size=sample_size, replace=False)]
+    centroids = data[rng.choice(data.shape[0], size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignment = _nearest_centroid(data, centroids)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.stack([
+            np.bincount(assignment, weights=data[:, j], minlength=n_clusters)
+            for j in range(data.shape[1])
+        ], axis=1)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters on random rows instead of dropping them.
+        if empty.any():
+            centroids[empty] = data[rng.choice(data.shape[0], size=int(empty.sum()), replace=False)]
+    return centroids
+
+
+INDEX_KINDS = {
+    "brute": BruteForceIndex,
+    "kd_tree": lambda data, **params: TreeIndex(data, kind="kd_tree", **params),
+    "ball_tree": lambda data, **params: TreeIndex(data, kind="ball_tree", **params),
+    "categorical": CategoricalIndex,
+    "compact": CompactIndex,
+    "ivf": IVFIndex,
+}
+
+
+def build_index(kind, data, **params):
+    """
+    Build the neighbor index ``kind`` (one of ``INDEX_KINDS``) over scaled ``data``.
+    """
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index kind {kind!r}; choose from {sorted(INDEX_KINDS)}")
+    return INDEX_KINDS[kind](data, **params)
+
+
+def measure_recall(index, queries, k, reference=None):
+    """
+    Compare ``index`` with exact brute force on the same scaled queries.
+
+    Returns recall@k (share of the true k nearest rows that were found), whether
+    the neighbor lists are identical, and the mean per-query latency of both
+    searches in milliseconds.
+    """
+    queries = np.asarray(queries, dtype=np.float64)
+    if reference is None:
+        reference = BruteForceIndex(index.data, p=index.p)
+
+    start = time.perf_counter()
+    _, expected = reference.query(queries, k)
+    brute_ms = (time.perf_counter() - start) * 1e3 / len(queries)
+
+    start = time.perf_counter()
+    _, found = index.query(queries, k)
+    index_ms = (time.perf_counter() - start) * 1e3 / len(queries)
+
+    hits = sum(len(np.intersect1d(e, f, assume_unique=True)) for e, f in zip(expected, found))
+    return {
+        "recall": hits / expected.size,
+        "identical": bool(np.array_equal(expected, found)),
+        "index_ms_per_query": index_ms,
+        "brute_ms_per_query": brute_ms,
+        "speedup": brute_ms / index_ms if index_ms else float("inf"),
+    }
+
+
+def load_reference(reference_size, seed=0):
+    """
+    The scaled KNN training matrix from ``knn_model.pkl``, topped up with
+    synthetic rows (scaled by ``scaler.pkl``) to ``reference_size`` rows.
+    Returns ``(reference, scaler)``.
+    """
+    import joblib
+
+    from synthetic import synthetic_rows
+
+    knn_model = joblib.load(os.path.join(BASE_DIR, "knn_model.pkl"))
+    scaler = joblib.load(os.path.join(BASE_DIR, "scaler.pkl"))
+    reference = np.asarray(knn_model._fit_X, dtype=np.float64)
+    extra = reference_size - reference.shape[0]
+    if extra > 0:
+        rows = synthetic_rows(extra, seed=seed).drop("target", axis=1)
+        reference = np.vstack([reference, scaler.transform(rows)])
+    return reference, scaler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure neighbor-index recall and latency against brute force.")
+    parser.add_argument("--kind", choices=sorted(INDEX_KINDS), default="ivf")
+    parser.add_argument("--reference-size", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--n-lists", type=int, default=None, help="IVF clusters (default ~sqrt(n))")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 16],
+                        help="IVF clusters scanned per query; several values sweep the recall/latency knob")
+    parser.add_argument("--storage", nargs="+", choices=COMPACT_STORAGE, default=list(COMPACT_STORAGE),
+                        help="compact index layouts to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from synthetic import synthetic_rows
+
+    reference, scaler = load_reference(args.reference_size, seed=args.seed)
+    queries = scaler.transform(synthetic_rows(args.queries, seed=args.seed + 1).drop("target", axis=1))
+    brute = BruteForceIndex(reference)
+
+    if args.kind == "ivf":
+        variants = [{"n_lists": args.n_lists}]
+    elif args.kind == "compact":
+        variants = [{"storage": storage} for storage in args.storage]
+    else:
+        variants = [{}]
+
+    for params in variants:
+        start = time.perf_counter()
+        index = build_index(args.kind, reference, **params)
+        build_s = time.perf_counter() - start
+
+        for n_probe in (args.n_probe if args.kind == "ivf" else [None]):
+            if n_probe is not None:
+                index.n_probe = n_probe
+            report = {"kind": args.kind, "reference_size": reference.shape[0], "k": args.k,
+                      "build_s": build_s, "reference_mb": reference.nbytes / 1e6}
+            if n_probe is not None:
+                report.update(n_lists=index.n_lists, n_probe=n_probe)
+            if args.kind == "compact":
+                report.update(storage=index.storage, index_mb=index.nbytes / 1e6,
+                              copied_reference=index.owns_data)
+            report.update(measure_recall(index, queries, args.k, reference=brute))
+            print(json.dumps(report))
+            if index.exact and not report["identical"]:
+                raise SystemExit(f"{args.kind} {params or ''}: neighbor lists differ from brute force")
+
+if __name__ == "__main__":
+    main()
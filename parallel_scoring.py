@@ -0,0 +1,181 @@
+"""
+Multi-core batch scoring over a shared, memory-mapped training matrix.
+
+``ParallelScorer`` splits the rows to score into contiguous chunks and farms
+them out to a process pool. Every worker maps the same ``knn_model.mmap``
+artifact (once, on its first task), so the reference set is mapped, not
+unpickled: all workers share the same page-cache pages and only the query rows
+and their results cross process boundaries. Chunks are reassembled in input
+order.
+
+Each task carries the artifact's file stamp, so when update_model.py publishes
+a new version the parent and every worker re-open the file before scoring.
+A pool whose worker died (``BrokenProcessPool``) is replaced and the batch
+retried once. The parent and the workers serve neighbor queries from the same
+index kind (``index``, default ``HEART_INDEX``, see artifacts.py).
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from artifacts import artifact_stamp, open_artifact, serving_index, write_artifact
+from predictor import Prediction
+
+# Chunks per worker; a few per worker keeps the pool busy when chunks finish unevenly.
+CHUNKS_PER_WORKER = 4
+
+_worker_path = None
+_worker_index = None
+_worker_stamp = None
+_worker_predictor = None
+
+
+def _init_worker(artifact_path, index):
+    global _worker_path, _worker_index
+    _worker_path = artifact_path
+    _worker_index = index
+
+
+def _score_chunk(task):
+    global _worker_stamp, _worker_predictor
+    stamp, X = task
+    if stamp != _worker_stamp:
+        _worker_predictor = open_artifact(_worker_path, index=_worker_index)
+        _worker_stamp = stamp
+    return tuple(_worker_predictor.predict(X))
+
+
+class ParallelScorer:
+    """
+    Process pool of predictors attached to one memory-mapped artifact.
+
+    Use as a context manager, or call ``close()`` when done. ``n_workers=1``
+    scores in-process without starting a pool.
+
+    One scorer can be shared between threads: ``predict(X, n_workers=2)`` keeps
+    a call to at most two workers of the pool, and ``close()`` waits for the
+    calls in flight before shutting the pool down.
+    """
+
+    def __init__(self, artifact_path, n_workers=None, start_method="spawn", index=None):
+        self.artifact_path = artifact_path
+        self.index = index or serving_index()
+        self.n_workers = max(1, int(n_workers or os.cpu_count() or 1))
+        self.start_method = start_method
+        self._stamp = artifact_stamp(artifact_path)
+        self._predictor = open_artifact(artifact_path, index=self.index)
+        self._tmp_path = None
+        self._pool = self._start_pool() if self.n_workers > 1 else None
+        self.closed = False
+        # Guards the pool and counts predict() calls in flight.
+        self._cond = threading.Condition()
+        self._active = 0
+
+    def _start_pool(self):
+        # "spawn" keeps workers clean when the parent is a threaded server
+        # (e.g. Streamlit); workers re-open the artifact instead of
+        # inheriting anything.
+        return ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+            initargs=(self.artifact_path, self.index),
+        )
+
+    @classmethod
+    def from_predictor(cls, predictor, n_workers=None, **kwargs):
+        """
+        Build a scorer for ``predictor``, writing a temporary artifact if it was
+        not opened from one.
+        """
+        path = getattr(predictor, "artifact_path", None)
+        if path is not None:
+            return cls(path, n_workers, **kwargs)
+        fd, tmp_path = tempfile.mkstemp(suffix=".mmap")
+        os.close(fd)
+        write_artifact(tmp_path, predictor)
+        scorer = cls(tmp_path, n_workers, **kwargs)
+        scorer._tmp_path = tmp_path
+        return scorer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            while self._active:
+                self._cond.wait()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._tmp_path is not None:
+            os.unlink(self._tmp_path)
+            self._tmp_path = None
+
+    def warm_up(self):
+        """
+        Start every worker process now instead of on the first batch.
+        """
+        if self._pool is not None:
+            row = np.zeros((1, self._predictor.n_features))
+            list(self._pool.map(_score_chunk, [(self._stamp, row)] * self.n_workers))
+
+    def _refresh(self):
+        stamp = artifact_stamp(self.artifact_path)
+        if stamp != self._stamp:
+            self._predictor = open_artifact(self.artifact_path, index=self.index)
+            self._stamp = stamp
+
+    def predict(self, X, chunk_rows=None, n_workers=None):
+        """
+        Score ``X`` across the pool; returns a ``Prediction`` in input order.
+
+        ``n_workers`` caps the workers this call uses (default: the whole pool).
+        """
+        with self._cond:
+            if self.closed:
+                raise RuntimeError("ParallelScorer is closed")
+            self._active += 1
+        try:
+            return self._predict(X, chunk_rows, n_workers)
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def _predict(self, X, chunk_rows, n_workers):
+        with self._cond:
+            self._refresh()
+            predictor, stamp, pool = self._predictor, self._stamp, self._pool
+        X = predictor.as_matrix(X)
+        n_workers = min(self.n_workers, int(n_workers or self.n_workers))
+        if pool is None or n_workers < 2 or len(X) < 2:
+            return predictor.predict(X)
+
+        if chunk_rows is None:
+            # A capped call submits one chunk per worker, so at most
+            # n_workers of its tasks are ever running.
+            n_chunks = n_workers * CHUNKS_PER_WORKER if n_workers == self.n_workers else n_workers
+            chunk_rows = -(-len(X) // n_chunks)
+        chunks = [(stamp, X[start:start + chunk_rows]) for start in range(0, len(X), chunk_rows)]
+        try:
+            parts = list(pool.map(_score_chunk, chunks))
+        except BrokenProcessPool:
+            # A worker died (OOM kill, crash): start a fresh pool (unless another
+            # call already did) and retry once.
+            with self._cond:
+                if self._pool is pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = self._start_pool()
+                pool = self._pool
+            parts = list(pool.map(_score_chunk, chunks))
+        return Prediction(*(np.concatenate(field) for field in zip(*parts)))
@@ -0,0 +1,163 @@
+"""
+Bounded LRU/TTL cache of single-row predictions.
+
+Eight of the 13 features are small categorical codes and the vitals come from
+coarse-step number inputs, so identical feature vectors arrive again and
+again. ``PredictionCache`` keys results on the exact feature vector, is safe to
+share between Streamlit sessions (one size limit for the whole process) and
+clears itself when it is bound to a different model artifact.
+
+Pass the model's ``artifact_token`` to ``get`` and ``put``: the lookup binds
+the cache under the same lock, and a result computed by a model that has
+since been replaced is dropped instead of stored under the new model.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import METRICS
+
+DEFAULT_MAXSIZE = 10_000
+
+
+def row_key(row):
+    """
+    Exact, hashable key for a raw feature row (``-0.0`` and ``0.0`` collide).
+    """
+    return (np.asarray(row, dtype=np.float64).ravel() + 0.0).tobytes()
+
+
+def artifact_token(predictor):
+    """
+    Identify the model behind ``predictor``; a new token invalidates the cache.
+    """
+    header = getattr(predictor, "artifact", None)
+    if header:
+        return header.get("artifact_id") or (header.get("model_version"), header.get("created"))
+    return id(predictor)
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live (seconds).
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = int(maxsize)
+        self.ttl = ttl
+        self.token = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bind(self, token):
+        """
+        Attach the cache to a model; switching to a different token clears it.
+        """
+        with self._lock:
+            self._bind(token)
+
+    def _bind(self, token):
+        if token != self.token:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.token = token
+
+    def get(self, key, token=None):
+        """
+        Return the cached value for ``key`` or ``None`` on a miss.
+
+        With ``token``, first bind the cache to that model (see ``bind``).
+        """
+        with self._lock:
+            if token is not None:
+                self._bind(token)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, token=None):
+        """
+        Store ``value`` under ``key``; with ``token``, only if the cache is
+        still bound to that model.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if token is not None and token != self.token:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class CachedPredictor:
+    """
+    ``KNNPredictor`` wrapper answering repeated single rows from a ``PredictionCache``.
+
+    Everything other than ``predict_one`` is delegated to the wrapped predictor.
+    """
+
+    def __init__(self, predictor, cache):
+        self.predictor = predictor
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.predictor, name)
+
+    def predict_one(self, row):
+        """
+        Cached ``KNNPredictor.predict_one``; returns ``(label, proba, distances)``.
+        """
+        token = artifact_token(self.predictor)
+        key = row_key(row)
+        result = self.cache.get(key, token)
+        METRICS.inc("heart_cache_lookups_total", result="miss" if result is None else "hit")
+        if result is None:
+            label, proba, distances = self.predictor.predict_one(row)
+            proba.flags.writeable = False
+            distances.flags.writeable = False
+            result = (label, proba, distances)
+            self.cache.put(key, result, token)
+        return result
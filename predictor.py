@@ -0,0 +1,287 @@
+"""
+Fused StandardScaler + KNN predictor.
+
+The apps used to build a DataFrame, call ``scaler.transform`` and then run the
+neighbor search twice (``predict`` and ``predict_proba``). ``KNNPredictor``
+folds the scaler into the stored training matrix once, at load time, and
+answers label, class probabilities and neighbor distances from a single
+vectorized NumPy query.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from metrics import BATCH_BUCKETS, METRICS
+
+FEATURE_NAMES = [
+    "age", "sex", "cp", "trestbps", "chol", "fbs",
+    "restecg", "thalach", "exang", "oldpeak", "slope", "ca", "thal"
+]
+# Low-cardinality codes vs. measured vitals, in FEATURE_NAMES order.
+CATEGORICAL_FEATURES = ["sex", "cp", "fbs", "restecg", "exang", "slope", "ca", "thal"]
+CONTINUOUS_FEATURES = ["age", "trestbps", "chol", "thalach", "oldpeak"]
+
+# Upper bound on the number of query x reference distances held in memory at
+# once (8 bytes each), so large batches are answered block by block.
+DEFAULT_BLOCK_ELEMENTS = 4_000_000
+
+Prediction = namedtuple("Prediction", ["labels", "proba", "distances", "indices"])
+
+
+def top_k(scores, k):
+    """
+    Column indices of the ``k`` smallest scores per row, closest first.
+
+    Equal scores fall back to column order so results are deterministic.
+    """
+    if k < scores.shape[1]:
+        candidates = np.argpartition(scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    rows = np.arange(scores.shape[0])[:, None]
+    order = np.lexsort((candidates, scores[rows, candidates]), axis=1)
+    return candidates[rows, order]
+
+
+def minkowski_distances(queries, neighbors, p=2):
+    """
+    Exact distances between each query row and its gathered neighbor rows.
+
+    ``queries`` is (n, d) and ``neighbors`` is (n, k, d); returns (n, k).
+    """
+    diff = queries[:, None, :] - neighbors
+    if p == 2:
+        return np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+    return np.sum(np.abs(diff) ** p, axis=2) ** (1.0 / p)
+
+
+class KNNPredictor:
+    """
+    Scaler-aware KNN classifier answering every output from one neighbor query.
+
+    ``train_scaled`` is the KNN training matrix exactly as the notebook fitted
+    it (already standardized), ``train_y`` the class index of each training
+    row into ``classes``. For Euclidean distance the scaler is folded into a
+    per-reference bias term, so raw (unscaled) rows are ranked with a single
+    matrix product and no per-request transform of the reference set.
+    """
+
+    def __init__(self, train_scaled, train_y, classes, mean, scale,
+                 n_neighbors=5, weights="uniform", p=2, feature_names=None,
+                 block_elements=DEFAULT_BLOCK_ELEMENTS, index=None, bias=None):
+        if weights not in ("uniform", "distance"):
+            raise ValueError(f"Unsupported weights: {weights!r}")
+        if not p >= 1:
+            raise ValueError(f"Minkowski p must be >= 1, got {p!r}")
+
+        self.train_scaled = np.asarray(train_scaled, dtype=np.float64)
+        self.train_y = np.asarray(train_y, dtype=np.intp)
+        self.classes = np.asarray(classes)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.n_neighbors = int(n_neighbors)
+        self.weights = weights
+        self.p = p
+        self.feature_names = list(feature_names) if feature_names is not None else list(FEATURE_NAMES)
+        self.block_elements = int(block_elements)
+        # Optional neighbor index (see neighbor_index.py) answering queries in
+        # scaled space; None keeps the fused brute-force search below.
+        self.index = index
+        self.index_kind = "brute" if index is None else type(index).__name__
+        # Header and path of the model artifact this predictor was opened from, if any.
+        self.artifact = None
+        self.artifact_path = None
+
+        n_train, n_features = self.train_scaled.shape
+        if self.n_neighbors > n_train:
+            raise ValueError(
+                f"n_neighbors={self.n_neighbors} exceeds the {n_train} training rows"
+            )
+        if self.mean.shape != (n_features,) or self.scale.shape != (n_features,):
+            raise ValueError("Scaler parameters do not match the training matrix width")
+
+        # Fold the scaler: with x_s = (x - mean) / scale,
+        #   ||x_s - t||^2 = ||x_s||^2 - 2 (x / scale) . t + (||t||^2 + 2 (mean / scale) . t)
+        # so only the query is divided by ``scale`` and the mean shift lives
+        # in a per-reference bias computed once here (or loaded precomputed
+        # from a model artifact).
+        self._inv_scale = 1.0 / self.scale
+        self._shift = self.mean * self._inv_scale
+        self._bias = None
+        if self.p == 2:
+            if bias is not None:
+                self._bias = np.asarray(bias, dtype=np.float64)
+            else:
+                self._bias = self.fold_bias(self.train_scaled, self.mean, self.scale)
+
+    @staticmethod
+    def fold_bias(train_scaled, mean, scale):
+        """
+        Per-reference bias ``||t||^2 + 2 (mean / scale) . t`` of the folded scaler.
+        """
+        t = np.asarray(train_scaled, dtype=np.float64)
+        shift = np.asarray(mean, dtype=np.float64) * (1.0 / np.asarray(scale, dtype=np.float64))
+        return np.einsum("ij,ij->i", t, t) + 2.0 * (t @ shift)
+
+    @classmethod
+    def from_sklearn(cls, knn_model, scaler, **kwargs):
+        """
+        Build a predictor from a fitted ``KNeighborsClassifier`` and ``StandardScaler``.
+        """
+        metric = getattr(knn_model, "effective_metric_", knn_model.metric)
+        params = dict(getattr(knn_model, "effective_metric_params_", None) or {})
+        if metric == "euclidean":
+            p = 2
+        elif metric == "manhattan":
+            p = 1
+        elif metric == "minkowski":
+            p = params.get("p", knn_model.p)
+        else:
+            raise ValueError(f"Unsupported KNN metric: {metric!r}")
+        if callable(knn_model.weights):
+            raise ValueError("Callable KNN weights are not supported")
+
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(scaler.n_features_in_)
+        scale = scaler.scale_ if scaler.with_std else np.ones(scaler.n_features_in_)
+        feature_names = getattr(scaler, "feature_names_in_", None)
+        return cls(
+            knn_model._fit_X, knn_model._y, knn_model.classes_, mean, scale,
+            n_neighbors=knn_model.n_neighbors, weights=knn_model.weights, p=p,
+            feature_names=feature_names, **kwargs
+        )
+
+    def use_index(self, kind, **params):
+        """
+        Serve neighbor queries from a ``neighbor_index`` backend built over the
+        scaled training matrix; ``kind="brute"`` restores the fused search.
+        """
+        from neighbor_index import build_index
+
+        with METRICS.timer("build_index", index=kind):
+            self.index = None if kind == "brute" else build_index(kind, self.train_scaled, p=self.p, **params)
+        self.index_kind = kind
+        METRICS.inc("heart_index_builds_total", index=kind)
+        return self
+
+    @property
+    def n_features(self):
+        return self.train_scaled.shape[1]
+
+    def as_matrix(self, X):
+        """
+        Coerce rows (list, ndarray or DataFrame) into a 2-D float64 feature matrix.
+
+        DataFrames must carry exactly the training feature names, in order,
+        mirroring the check ``scaler.transform`` performed before.
+        """
+        columns = getattr(X, "columns", None)
+        if columns is not None:
+            columns = [str(c) for c in columns]
+            if columns != self.feature_names:
+                missing = [c for c in self.feature_names if c not in columns]
+                extra = [c for c in columns if c not in self.feature_names]
+                raise ValueError(
+                    "Feature names must match those seen at fit time, in the same order. "
+                    f"Missing: {missing}; unexpected: {extra}"
+                )
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(
+                f"Expected rows with {self.n_features} features, got shape {X.shape}"
+            )
+        return X
+
+    def transform(self, X):
+        """
+        Standardize raw rows exactly like the fitted ``StandardScaler``.
+        """
+        X = self.as_matrix(X)
+        return (X - self.mean) / self.scale
+
+    def kneighbors(self, X):
+        """
+        Return ``(distances, indices)`` of the nearest training rows, closest first.
+        """
+        X = self.as_matrix(X)
+        k = self.n_neighbors
+        if self.index is not None:
+            return self.index.query((X - self.mean) / self.scale, k)
+
+        n_queries = X.shape[0]
+        distances = np.empty((n_queries, k), dtype=np.float64)
+        indices = np.empty((n_queries, k), dtype=np.intp)
+
+        # The Minkowski path materializes per-feature differences as well.
+        per_query = self.train_scaled.shape[0] * (1 if self.p == 2 else self.n_features)
+        step = max(1, self.block_elements // per_query)
+        for start in range(0, n_queries, step):
+            stop = min(start + step, n_queries)
+            d, i = self._kneighbors_block(X[start:stop], k)
+            distances[start:stop] = d
+            indices[start:stop] = i
+        return distances, indices
+
+    def _kneighbors_block(self, X, k):
+        queries = (X - self.mean) / self.scale
+        if self.p == 2:
+            # Rank on the folded form; the constant ||x_s||^2 is left out.
+            scores = self._bias - 2.0 * ((X * self._inv_scale) @ self.train_scaled.T)
+        else:
+            diff = np.abs(queries[:, None, :] - self.train_scaled[None, :, :])
+            scores = np.sum(diff ** self.p, axis=2)
+
+        indices = top_k(scores, k)
+        # Report exact distances for the k winners only.
+        distances = minkowski_distances(queries, self.train_scaled[indices], self.p)
+        return distances, indices
+
+    def _neighbor_weights(self, distances):
+        if self.weights == "uniform":
+            return np.ones_like(distances)
+        # Same convention as sklearn: an exact match takes all of the weight.
+        with np.errstate(divide="ignore"):
+            weights = 1.0 / distances
+        exact = np.isinf(weights)
+        exact_rows = exact.any(axis=1)
+        weights[exact_rows] = exact[exact_rows]
+        return weights
+
+    def predict(self, X):
+        """
+        Return a ``Prediction`` with labels, class probabilities, distances and indices.
+        """
+        with METRICS.timer("prepare_input"):
+            X = self.as_matrix(X)
+        METRICS.observe("heart_batch_rows", X.shape[0], BATCH_BUCKETS)
+        with METRICS.timer("neighbor_search"):
+            distances, indices = self.kneighbors(X)
+
+        with METRICS.timer("vote"):
+            result = self._vote(distances, indices)
+        METRICS.inc("heart_predictions_total", len(result.labels))
+        return result
+
+    def _vote(self, distances, indices):
+        weights = self._neighbor_weights(distances)
+
+        n_queries = indices.shape[0]
+        proba = np.zeros((n_queries, len(self.classes)), dtype=np.float64)
+        rows = np.arange(n_queries)
+        neighbor_classes = self.train_y[indices]
+        for j in range(indices.shape[1]):
+            proba[rows, neighbor_classes[:, j]] += weights[:, j]
+        normalizer = proba.sum(axis=1)[:, None]
+        normalizer[normalizer == 0.0] = 1.0
+        proba /= normalizer
+
+        labels = self.classes[np.argmax(proba, axis=1)]
+        return Prediction(labels, proba, distances, indices)
+
+    def predict_one(self, row):
+        """
+        Predict a single raw feature row; returns ``(label, proba, distances)``.
+        """
+        result = self.predict(np.asarray(row, dtype=np.float64).reshape(1, -1))
+        return result.labels[0], result.proba[0], result.distances[0]
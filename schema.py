@@ -0,0 +1,230 @@
+"""
+Declared schema of the heart-disease CSV and a typed, validating reader.
+
+``HEART_SCHEMA`` lists the 13 features plus ``target`` in file order, with the
+compact dtype each column is parsed into and what values it may hold:
+allowed codes for the categorical columns, a numeric range and a number of
+decimals for the vitals. ``read_csv`` parses straight into those dtypes
+(int8 codes, float32 vitals) with pyarrow (listed in requirements.txt), or
+the pandas C parser on an install without it, then validates the whole frame
+in vectorized passes. Any problem raises ``SchemaError`` carrying every bad
+cell at once, so a file is rejected before any scoring starts.
+
+``feature_matrix`` widens the compact columns back to the float64 matrix the
+predictor expects; vitals are rounded to their declared decimals so float32
+storage never changes a prediction.
+"""
+import io
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from batch_eval import iter_csv_chunks
+from predictor import FEATURE_NAMES
+
+# ``codes``: allowed values (categorical columns); ``low``/``high``/``decimals``:
+# inclusive range and maximum number of decimals (numeric columns).
+ColumnSpec = namedtuple("ColumnSpec", ["name", "dtype", "codes", "low", "high", "decimals"])
+
+HEART_SCHEMA = [
+    ColumnSpec("age", "float32", None, 0, 120, 0),
+    ColumnSpec("sex", "int8", (0, 1), None, None, 0),
+    ColumnSpec("cp", "int8", (0, 1, 2, 3), None, None, 0),
+    ColumnSpec("trestbps", "float32", None, 50, 250, 0),
+    ColumnSpec("chol", "float32", None, 50, 700, 0),
+    ColumnSpec("fbs", "int8", (0, 1), None, None, 0),
+    ColumnSpec("restecg", "int8", (0, 1, 2), None, None, 0),
+    ColumnSpec("thalach", "float32", None, 50, 250, 0),
+    ColumnSpec("exang", "int8", (0, 1), None, None, 0),
+    ColumnSpec("oldpeak", "float32", None, -3.0, 10.0, 1),
+    ColumnSpec("slope", "int8", (0, 1, 2), None, None, 0),
+    ColumnSpec("ca", "int8", (0, 1, 2, 3), None, None, 0),
+    ColumnSpec("thal", "int8", (0, 1, 2, 3), None, None, 0),
+    ColumnSpec("target", "int8", (0, 1), None, None, 0),
+]
+SCHEMA_BY_NAME = {spec.name: spec for spec in HEART_SCHEMA}
+assert [spec.name for spec in HEART_SCHEMA[:-1]] == FEATURE_NAMES
+
+# Cap on the number of problems kept, so a completely wrong file stays cheap to report.
+MAX_PROBLEMS = 1000
+
+
+class SchemaError(ValueError):
+    """
+    Raised when a CSV does not match ``HEART_SCHEMA``.
+
+    ``problems`` is a DataFrame with one row per bad cell (``line``, ``column``,
+    ``value``, ``problem``); ``line`` is the 1-based line in the file, header
+    included. It is empty for header-level errors.
+    """
+
+    def __init__(self, message, problems=None):
+        super().__init__(message)
+        self.problems = problems if problems is not None else _problem_frame([])
+
+
+def _problem_frame(rows):
+    return pd.DataFrame(rows, columns=["line", "column", "value", "problem"])
+
+
+def expected_columns(require_target=True):
+    return [spec.name for spec in HEART_SCHEMA if require_target or spec.name != "target"]
+
+
+def check_columns(columns, require_target=True):
+    """
+    Raise ``SchemaError`` unless ``columns`` are exactly the schema's, in order.
+    """
+    columns = [str(c) for c in columns]
+    expected = expected_columns(require_target)
+    if not require_target and columns and columns[-1] == "target":
+        expected = expected + ["target"]
+    if columns == expected:
+        return
+    missing = [c for c in expected if c not in columns]
+    extra = [c for c in columns if c not in expected]
+    if missing or extra:
+        raise SchemaError(f"CSV columns do not match the schema. Missing: {missing}; unexpected: {extra}")
+    raise SchemaError(f"CSV columns are out of order. Expected: {', '.join(expected)}")
+
+
+def validate(df, first_line=2):
+    """
+    Return every schema violation in ``df`` as a problems DataFrame (empty if valid).
+
+    ``first_line`` is the file line of ``df``'s first row (2 = right after the header).
+    """
+    problems = []
+    lines = np.arange(first_line, first_line + len(df))
+    for name in df.columns:
+        spec = SCHEMA_BY_NAME[name]
+        values = df[name].to_numpy()
+        numeric = np.asarray(values, dtype=np.float64)
+
+        checks = [(np.isnan(numeric), "missing or not a number")]
+        with np.errstate(invalid="ignore"):
+            if spec.codes is not None:
+                checks.append((~np.isnan(numeric) & ~np.isin(numeric, spec.codes),
+                               f"not one of {list(spec.codes)}"))
+            else:
+                checks.append(((numeric < spec.low) | (numeric > spec.high),
+                               f"outside [{spec.low}, {spec.high}]"))
+                # float32 storage is only exact after rounding to the declared decimals.
+                scaled = numeric * 10.0 ** spec.decimals
+                checks.append((np.abs(scaled - np.round(scaled)) > 1e-3,
+                               f"more than {spec.decimals} decimals"))
+        for mask, problem in checks:
+            for i in np.flatnonzero(mask)[:MAX_PROBLEMS - len(problems)]:
+                problems.append((int(lines[i]), name, values[i], problem))
+            if len(problems) >= MAX_PROBLEMS:
+                return _problem_frame(problems).sort_values(["line", "column"], ignore_index=True)
+    return _problem_frame(problems).sort_values(["line", "column"], ignore_index=True)
+
+
+def _finish(df, first_line=2, require_target=True, text=None):
+    """
+    Validate ``df`` and narrow it to the schema dtypes.
+
+    ``text`` holds the cells as written in the file for columns that had to be
+    coerced to numbers; problems then report the original text, not NaN.
+    """
+    check_columns(df.columns, require_target)
+    problems = validate(df, first_line)
+    if len(problems):
+        if text is not None:
+            problems["value"] = [
+                text[column].iloc[line - first_line] if column in text.columns else value
+                for line, column, value in zip(problems["line"], problems["column"], problems["value"])
+            ]
+        shown = f"first {MAX_PROBLEMS} " if len(problems) >= MAX_PROBLEMS else ""
+        raise SchemaError(f"{len(problems)} {shown}invalid values in {problems['line'].nunique()} rows", problems)
+    return df.astype({name: SCHEMA_BY_NAME[name].dtype for name in df.columns})
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def _read_typed(source):
+    """
+    Parse ``source`` straight into the schema dtypes.
+
+    Codes are read as int8 by pandas' C parser, but by pyarrow as float32 so
+    an empty cell becomes NaN (reported by ``validate``) instead of an error.
+    pyarrow only reads paths and binary streams.
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        pa_csv = None
+    if pa_csv is None or isinstance(source, io.TextIOBase):
+        return pd.read_csv(source, dtype={spec.name: spec.dtype for spec in HEART_SCHEMA})
+
+    table = pa_csv.read_csv(source, convert_options=pa_csv.ConvertOptions(
+        column_types={spec.name: pa.float32() for spec in HEART_SCHEMA}
+    ))
+    return table.to_pandas()
+
+
+def _read_lenient(source):
+    """
+    Parse every cell as text and coerce it, so bad cells show up as NaN.
+    """
+    df = pd.read_csv(source, dtype=str, keep_default_na=False)
+    return df, df.apply(pd.to_numeric, errors="coerce")
+
+
+def read_csv(source, require_target=True):
+    """
+    Read a CSV path or file object into a frame with the schema's compact dtypes.
+
+    Raises ``SchemaError`` listing every invalid cell if the file does not conform.
+    """
+    try:
+        df = _read_typed(source)
+    except ValueError:
+        # A cell the typed parser cannot convert: re-read leniently so the
+        # report names every bad cell, not just the first one.
+        _rewind(source)
+        text, df = _read_lenient(source)
+        return _finish(df, require_target=require_target, text=text)
+    return _finish(df, require_target=require_target)
+
+
+def iter_typed_chunks(source, chunksize, require_target=True):
+    """
+    Yield validated, compactly typed chunks of a CSV too large to read at once.
+
+    Each chunk is checked before it is yielded, so scoring stops at the first
+    chunk with bad rows. The error lists every bad cell in that chunk with its
+    line in the file, as ``read_csv`` does.
+    """
+    # Inferred dtypes, so a cell that is not a number only turns its column
+    # into text for this chunk, instead of failing the whole reader. Those
+    # columns are coerced (bad cells become NaN, reported by validate()) and
+    # _finish() then narrows everything to the schema dtypes.
+    first_line = 2
+    for chunk in iter_csv_chunks(source, chunksize):
+        check_columns(chunk.columns, require_target)
+        text = None
+        unparsed = [name for name in chunk.columns if not pd.api.types.is_numeric_dtype(chunk[name])]
+        if unparsed:
+            text = chunk[unparsed]
+            chunk = chunk.assign(**{name: pd.to_numeric(chunk[name], errors="coerce") for name in unparsed})
+        yield _finish(chunk, first_line, require_target, text)
+        first_line += len(chunk)
+
+
+def feature_matrix(df):
+    """
+    Float64 feature matrix of a typed frame, vitals rounded to their declared decimals.
+    """
+    X = np.empty((len(df), len(FEATURE_NAMES)), dtype=np.float64)
+    for j, name in enumerate(FEATURE_NAMES):
+        column = df[name].to_numpy(dtype=np.float64)
+        decimals = SCHEMA_BY_NAME[name].decimals
+        X[:, j] = np.round(column, decimals) if df[name].dtype.kind == "f" else column
+    return X
@@ -0,0 +1,196 @@
+"""
+Columnar export of scored rows for the batch tester and downstream systems.
+
+``ScoredWriter`` appends each scored chunk to a Parquet or Arrow IPC file as
+soon as it is scored: the uploaded columns in their compact schema dtypes,
+``predicted_target``, one ``proba_<class>`` column per class and, optionally,
+``distance_1`` ... ``distance_k`` to the nearest training rows. Only the
+chunk being written is ever held in memory, so a streamed scoring job ends
+with the same footprint it started with and a file a warehouse can load
+directly.
+
+Rows are written in row groups (record batches for Arrow) of at most
+``row_group_size`` rows, however large the chunk. ``ScoredFile`` reads the
+file back one page at a time for the browser preview: an Arrow IPC file is
+memory-mapped and sliced without copying, and for Parquet only the row
+groups covering the page are decoded.
+
+Run ``python scored_output.py big.csv -o scored.parquet`` to score a CSV into
+a file without the app. Requires pyarrow (listed in requirements.txt, and a
+Streamlit dependency too).
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+# Rows per Parquet row group / Arrow record batch: the most a preview page decodes.
+DEFAULT_ROW_GROUP_SIZE = 10_000
+
+FORMATS = {
+    # name -> (file extension, MIME type)
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("scored_output.py needs the pyarrow package (pip install -r requirements.txt)") from None
+
+
+def scored_columns(prediction, classes, distances=False):
+    """
+    Output columns of one scored chunk, in file order, from a ``Prediction``.
+
+    Probabilities and distances are stored as float32.
+    """
+    columns = {"predicted_target": np.asarray(prediction.labels)}
+    for j, label in enumerate(classes):
+        columns[f"proba_{label}"] = prediction.proba[:, j].astype(np.float32)
+    if distances:
+        for j in range(prediction.distances.shape[1]):
+            columns[f"distance_{j + 1}"] = prediction.distances[:, j].astype(np.float32)
+    return columns
+
+
+class ScoredWriter:
+    """
+    Append scored chunks to a Parquet or Arrow IPC file.
+
+    The first chunk fixes the schema; later chunks are cast to it, so a column
+    that happens to parse differently in one chunk cannot break the file.
+    Parquet is zstd-compressed by default; Arrow IPC is left uncompressed so
+    readers can memory-map it.
+    """
+
+    def __init__(self, path, format="parquet", compression=None, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format!r}; expected one of {sorted(FORMATS)}")
+        _require_pyarrow()
+        self.path = path
+        self.format = format
+        self.compression = compression
+        self.row_group_size = int(row_group_size)
+        self.n_rows = 0
+        self._writer = None
+        self._schema = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, frame, columns):
+        """
+        Append ``frame`` (the input rows) plus ``columns`` (name -> array of the same length).
+        """
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        for name, values in columns.items():
+            table = table.append_column(name, pa.array(values))
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = self._open(table.schema)
+        else:
+            table = table.cast(self._schema)
+        if self.format == "parquet":
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+        else:
+            self._writer.write_table(table, max_chunksize=self.row_group_size)
+        self.n_rows += table.num_rows
+
+    def _open(self, schema):
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetWriter(self.path, schema, compression=self.compression or "zstd")
+        import pyarrow as pa
+
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        return pa.ipc.new_file(self.path, schema, options=options)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ScoredFile:
+    """
+    Paginated, read-only view of a file written by ``ScoredWriter``.
+    """
+
+    def __init__(self, path):
+        _require_pyarrow()
+        import pyarrow as pa
+
+        self.path = path
+        if path.endswith(FORMATS["arrow"][0]):
+            # Uncompressed record batches in a memory map: slicing copies nothing.
+            self._table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            self._parquet = None
+            self.n_rows = self._table.num_rows
+        else:
+            import pyarrow.parquet as pq
+
+            self._table = None
+            self._parquet = pq.ParquetFile(path, memory_map=True)
+            counts = [self._parquet.metadata.row_group(i).num_rows
+                      for i in range(self._parquet.metadata.num_row_groups)]
+            self._group_starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            self.n_rows = int(self._group_starts[-1])
+
+    def page(self, page=0, page_size=100):
+        """
+        Rows ``[page * page_size, (page + 1) * page_size)`` as a DataFrame indexed by row number.
+        """
+        start = min(max(0, int(page)) * int(page_size), self.n_rows)
+        stop = min(start + int(page_size), self.n_rows)
+        if self._table is not None:
+            table = self._table.slice(start, stop - start)
+        elif start == stop:
+            table = self._parquet.schema_arrow.empty_table()
+        else:
+            # Row groups [first, last) hold rows [start, stop).
+            first = int(np.searchsorted(self._group_starts, start, side="right")) - 1
+            last = int(np.searchsorted(self._group_starts, stop, side="left"))
+            table = self._parquet.read_row_groups(list(range(first, last)))
+            table = table.slice(start - int(self._group_starts[first]), stop - start)
+        df = table.to_pandas()
+        df.index = np.arange(start, stop)
+        return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV into a Parquet or Arrow IPC file.")
+    parser.add_argument("csv")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--format", choices=sorted(FORMATS), default=None,
+                        help="default: from the output file extension, else parquet")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--distances", action="store_true", help="also write neighbor distances")
+    parser.add_argument("--no-target", action="store_true", help="the CSV has no target column")
+    args = parser.parse_args(argv)
+
+    from artifacts import open_artifact
+    from schema import feature_matrix, iter_typed_chunks
+
+    fmt = args.format or ("arrow" if args.output.endswith(FORMATS["arrow"][0]) else "parquet")
+    predictor = open_artifact()
+    start = time.perf_counter()
+    with ScoredWriter(args.output, fmt) as writer:
+        for chunk in iter_typed_chunks(args.csv, args.chunk_size, require_target=not args.no_target):
+            prediction = predictor.predict(feature_matrix(chunk))
+            writer.write(chunk, scored_columns(prediction, predictor.classes, args.distances))
+    print(f"Wrote {writer.n_rows:,} rows to {args.output} ({fmt}, "
+          f"{os.path.getsize(args.output) / 2**20:.1f} MiB) in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
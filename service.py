@@ -0,0 +1,378 @@
+"""
+Headless prediction service with request micro-batching.
+
+A dependency-free asyncio HTTP/JSON server around the same memory-mapped KNN
+artifact the Streamlit apps use. Concurrent single-row requests are gathered
+into micro-batches (up to ``max_batch_size`` rows, waiting at most
+``max_wait_ms`` for the batch to fill) and each batch is answered by one
+vectorized neighbor query.
+
+Endpoints:
+
+- ``POST /predict`` with ``{"features": [13 values]}`` or
+  ``{"features": {"age": ..., ...}}``; ``{"instances": [...]}`` scores several
+  rows in one call.
+- ``GET /healthz``: the process is up (plus the neighbor index kind and batch
+  and cache counters).
+- ``GET /readyz``: the model is loaded and the batcher is accepting work.
+- ``GET /metrics``: stage latencies and counters in the Prometheus text format
+  (populated when ``HEART_METRICS=1``, see metrics.py).
+
+Run with ``python service.py --port 8600``; ``--index`` (default
+``HEART_INDEX``, else ``brute``) picks the neighbor index. The Streamlit apps become thin
+clients of a running service when ``HEART_SERVICE_URL`` is set (see
+``predict_remote``).
+"""
+import argparse
+import asyncio
+import json
+import math
+import urllib.request
+
+import numpy as np
+
+from artifacts import ARTIFACT_PATH, open_artifact, serving_index
+from metrics import METRICS
+from neighbor_index import INDEX_KINDS
+from prediction_cache import PredictionCache, artifact_token, row_key
+
+MAX_BODY_BYTES = 1 << 20
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+ROUTES = ("/healthz", "/readyz", "/metrics", "/predict")
+
+
+class MicroBatcher:
+    """
+    Collect single rows from concurrent callers into batched ``predict`` calls.
+    """
+
+    def __init__(self, predictor, max_batch_size=64, max_wait_ms=2.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predictor = predictor
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.n_batches = 0
+        self.n_rows = 0
+        self._queue = None
+        self._worker = None
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, row):
+        """
+        Queue one raw feature row; resolves to ``(label, proba, distances)``.
+        """
+        if not self.running:
+            raise RuntimeError("Batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            rows = np.stack([row for row, _ in batch])
+            try:
+                result = await loop.run_in_executor(None, self.predictor.predict, rows)
+            except Exception as e:
+                METRICS.inc("heart_errors_total", stage="micro_batch")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.n_batches += 1
+            self.n_rows += len(batch)
+            for i, (_, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result((result.labels[i], result.proba[i], result.distances[i]))
+
+
+class RequestError(Exception):
+    """
+    A client error that maps to an HTTP status code.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _content_length(headers):
+    """
+    The request's ``Content-Length`` as an int in ``[0, MAX_BODY_BYTES]``.
+    """
+    value = headers.get("content-length", "0")
+    if not (value.isascii() and value.isdigit()):
+        raise RequestError(400, "Content-Length must be a non-negative integer")
+    length = int(value)
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, f"Body exceeds {MAX_BODY_BYTES} bytes")
+    return length
+
+
+class PredictionService:
+    """
+    asyncio HTTP server exposing a ``KNNPredictor`` through a ``MicroBatcher``.
+    """
+
+    def __init__(self, predictor, max_batch_size=64, max_wait_ms=2.0, cache=None):
+        self.predictor = predictor
+        self.batcher = MicroBatcher(predictor, max_batch_size, max_wait_ms)
+        # Optional PredictionCache consulted before a row joins a batch.
+        self.cache = cache
+        if cache is not None:
+            cache.bind(artifact_token(predictor))
+        self._server = None
+
+    @property
+    def ready(self):
+        return self._server is not None and self.batcher.running
+
+    async def start(self, host="127.0.0.1", port=8600):
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.batcher.stop()
+
+    def parse_row(self, features):
+        """
+        Turn a JSON feature list or ``{name: value}`` object into a float64 row.
+        """
+        names = self.predictor.feature_names
+        if isinstance(features, dict):
+            missing = [name for name in names if name not in features]
+            extra = [name for name in features if name not in names]
+            if missing or extra:
+                raise RequestError(400, f"Feature names must be {names}. Missing: {missing}; unexpected: {extra}")
+            features = [features[name] for name in names]
+        if not isinstance(features, list) or len(features) != len(names):
+            raise RequestError(400, f"Expected {len(names)} feature values in the order {names}")
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in features):
+            raise RequestError(400, "Feature values must be numbers")
+        if not all(math.isfinite(v) for v in features):
+            raise RequestError(400, "Feature values must be finite")
+        return np.asarray(features, dtype=np.float64)
+
+    async def predict(self, payload):
+        if not isinstance(payload, dict) or ("features" in payload) == ("instances" in payload):
+            raise RequestError(400, 'Body must be a JSON object with either "features" or "instances"')
+        if "features" in payload:
+            return self._format(await self.score(self.parse_row(payload["features"])))
+
+        instances = payload["instances"]
+        if not isinstance(instances, list) or not instances:
+            raise RequestError(400, '"instances" must be a non-empty list')
+        rows = [self.parse_row(features) for features in instances]
+        results = await asyncio.gather(*(self.score(row) for row in rows))
+        return {"predictions": [self._format(result) for result in results]}
+
+    async def score(self, row):
+        """
+        Answer one row from the cache, or through the micro-batcher on a miss.
+        """
+        if self.cache is None:
+            return await self.batcher.submit(row)
+        token = artifact_token(self.predictor)
+        key = row_key(row)
+        result = self.cache.get(key, token)
+        if result is None:
+            result = await self.batcher.submit(row)
+            self.cache.put(key, result, token)
+        return result
+
+    def _format(self, result):
+        label, proba, distances = result
+        return {
+            "label": label.item(),
+            "classes": self.predictor.classes.tolist(),
+            "probabilities": proba.tolist(),
+            "distances": distances.tolist(),
+        }
+
+    async def route(self, method, path, body):
+        if path == "/healthz":
+            if method != "GET":
+                raise RequestError(405, "Use GET")
+            status = {
+                "status": "ok", "index": self.predictor.index_kind,
+                "batches": self.batcher.n_batches, "rows": self.batcher.n_rows,
+            }
+            if self.cache is not None:
+                status["cache"] = self.cache.stats()
+            return 200, status
+        if path == "/readyz":
+            if method != "GET":
+                raise RequestError(405, "Use GET")
+            return (200, {"status": "ready"}) if self.ready else (503, {"status": "not ready"})
+        if path == "/metrics":
+            if method != "GET":
+                raise RequestError(405, "Use GET")
+            return 200, METRICS.render()
+        if path == "/predict":
+            if method != "POST":
+                raise RequestError(405, "Use POST")
+            if not self.ready:
+                raise RequestError(503, "Model is not ready")
+            try:
+                payload = json.loads(body or b"null")
+            except ValueError as e:
+                raise RequestError(400, f"Invalid JSON: {e}") from None
+            return 200, await self.predict(payload)
+        raise RequestError(404, f"No route for {path}")
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Malformed request line"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                path = target.split("?", 1)[0]
+                route = path if path in ROUTES else "other"
+                body = None
+                try:
+                    length = _content_length(headers)
+                    body = await reader.readexactly(length) if length else b""
+                    with METRICS.timer("request", path=route):
+                        status, payload = await self.route(method.upper(), path, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                    # A body that was never read leaves the stream unframed.
+                    keep_alive = keep_alive and body is not None
+                except ValueError as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    METRICS.inc("heart_errors_total", stage="service")
+                    status, payload = 500, {"error": f"Prediction failed: {e}"}
+                METRICS.inc("heart_requests_total", path=route, status=status)
+
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def predict_remote(url, features, timeout=5.0):
+    """
+    Score one row on a running service; returns ``(label, proba, distances)``.
+    """
+    request = urllib.request.Request(
+        url.rstrip("/") + "/predict",
+        data=json.dumps({"features": [float(v) for v in features]}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        result = json.loads(response.read())
+    return result["label"], result["probabilities"], result["distances"]
+
+
+async def _serve(args):
+    cache = PredictionCache(args.cache_size, ttl=args.cache_ttl) if args.cache_size > 0 else None
+    service = PredictionService(open_artifact(args.artifact, index=args.index), args.max_batch_size, args.max_wait_ms, cache)
+    host, port = await service.start(args.host, args.port)
+    print(f"Serving predictions on http://{host}:{port} "
+          f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms)")
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve KNN heart-disease predictions over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--artifact", default=ARTIFACT_PATH)
+    parser.add_argument("--index", choices=sorted(INDEX_KINDS), default=serving_index(),
+                        help="neighbor index kind (default: $HEART_INDEX, else brute)")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--cache-size", type=int, default=10_000, help="prediction cache entries (0 disables)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="prediction cache time-to-live in seconds")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Synthetic patient rows shaped like the Cleveland dataset.
+
+Used to grow the KNN reference set (and benchmark queries) far beyond the ~300
+real rows. Categorical codes are resampled jointly from real rows of the same
+class, so only realistic code combinations appear; vitals are drawn from
+per-class normal distributions, clipped to the observed range and rounded like
+the source columns.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from predictor import CATEGORICAL_FEATURES, CONTINUOUS_FEATURES, FEATURE_NAMES
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_PATH = os.path.join(BASE_DIR, "Heart_disease_cleveland_new.csv")
+
+
+def load_dataset(path=DATASET_PATH):
+    """
+    Read the Cleveland CSV (features + ``target``).
+    """
+    return pd.read_csv(path, encoding="utf-8-sig")
+
+
+def synthetic_rows(n_rows, source=None, seed=0):
+    """
+    Return a DataFrame of ``n_rows`` synthetic rows with FEATURE_NAMES + ``target``.
+    """
+    if source is None:
+        source = load_dataset()
+    rng = np.random.default_rng(seed)
+
+    class_freq = source["target"].value_counts(normalize=True).sort_index()
+    targets = rng.choice(class_freq.index.to_numpy(), size=n_rows, p=class_freq.to_numpy())
+
+    columns = {name: np.empty(n_rows, dtype=source[name].dtype) for name in FEATURE_NAMES}
+    for label in class_freq.index:
+        mask = targets == label
+        n_label = int(mask.sum())
+        if n_label == 0:
+            continue
+        rows = source[source["target"] == label]
+
+        picks = rng.integers(0, len(rows), size=n_label)
+        for name in CATEGORICAL_FEATURES:
+            columns[name][mask] = rows[name].to_numpy()[picks]
+
+        for name in CONTINUOUS_FEATURES:
+            values = rows[name].to_numpy(dtype=np.float64)
+            sample = rng.normal(values.mean(), values.std(), size=n_label)
+            sample = np.clip(sample, source[name].min(), source[name].max())
+            if np.issubdtype(source[name].dtype, np.integer):
+                sample = np.rint(sample)
+            else:
+                sample = np.round(sample, 1)
+            columns[name][mask] = sample.astype(source[name].dtype)
+
+    df = pd.DataFrame(columns, columns=FEATURE_NAMES)
+    df["target"] = targets.astype(source["target"].dtype)
+    return df
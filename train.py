@@ -0,0 +1,300 @@
+"""
+Parallel training pipeline replacing the notebook's sequential model zoo.
+
+One command runs a cross-validated hyperparameter search for every model the
+notebook fits (Logistic Regression, KNN, SVM, Decision Tree, Random Forest,
+XGBoost, Gradient Boosting), refits the winners and writes the artifacts the
+apps load::
+
+    python train.py --n-jobs -1
+
+- The train/test split matches the notebook (20% test, stratified,
+  ``random_state=42``).
+- CV folds are scaled once: each fold's StandardScaler is fit on that fold's
+  training part, and the cached scaled matrices are shared by every scaled
+  model (LR, KNN, SVM) and parameter combination. Tree models use raw features.
+- Every (model, parameters, fold) fit is an independent task, so the whole
+  search is one flat joblib sweep across cores instead of model after model.
+- KNN is not grid-searched: ``knn_sweep.py`` scores its whole grid from one
+  neighbor ranking per (fold, metric) on the same cached folds.
+- Outputs: ``knn_model.pkl`` + ``knn_model.mmap``, ``scaler.pkl``,
+  ``heart_disease_model.pkl`` (best model by CV accuracy) and
+  ``training_report.json`` with timings and metrics. A best model fitted on
+  scaled features is saved as a ``Pipeline`` with its scaler, so the pickle
+  always takes raw features.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, train_test_split
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+
+from artifacts import export_sklearn
+from knn_sweep import select_best, sweep_folds
+from predictor import FEATURE_NAMES
+from synthetic import DATASET_PATH, load_dataset
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+try:
+    from xgboost import XGBClassifier
+except ImportError:
+    XGBClassifier = None
+
+
+def model_specs():
+    """
+    ``name -> (estimator, parameter grid, uses scaled features)``.
+    """
+    specs = {
+        "logistic_regression": (
+            LogisticRegression(random_state=42, max_iter=1000),
+            {"C": [0.01, 0.1, 1.0, 10.0]},
+            True,
+        ),
+        "knn": (
+            KNeighborsClassifier(),
+            {"n_neighbors": list(range(1, 31)), "weights": ["uniform", "distance"], "p": [1, 2]},
+            True,
+        ),
+        "svm": (
+            SVC(random_state=42),
+            {"C": [0.1, 1.0, 10.0], "gamma": ["scale", 0.01, 0.1]},
+            True,
+        ),
+        "decision_tree": (
+            DecisionTreeClassifier(random_state=42),
+            {"max_depth": [None, 3, 5, 7], "min_samples_leaf": [1, 5, 10]},
+            False,
+        ),
+        "random_forest": (
+            RandomForestClassifier(random_state=42, n_jobs=1),
+            {"n_estimators": [100, 300], "max_depth": [None, 5, 10]},
+            False,
+        ),
+        "gradient_boosting": (
+            GradientBoostingClassifier(random_state=42),
+            {"n_estimators": [100, 200], "learning_rate": [0.05, 0.1], "max_depth": [2, 3]},
+            False,
+        ),
+    }
+    if XGBClassifier is not None:
+        specs["xgboost"] = (
+            XGBClassifier(eval_metric="logloss", random_state=42, n_jobs=1),
+            {"n_estimators": [100, 300], "max_depth": [3, 5], "learning_rate": [0.05, 0.1]},
+            False,
+        )
+    return specs
+
+
+def build_folds(X, y, n_splits, seed):
+    """
+    Split ``X``/``y`` into CV folds with the scaled views computed once per fold.
+    """
+    folds = []
+    for train_idx, val_idx in StratifiedKFold(n_splits, shuffle=True, random_state=seed).split(X, y):
+        scaler = StandardScaler().fit(X[train_idx])
+        folds.append({
+            "raw": (X[train_idx], X[val_idx]),
+            "scaled": (scaler.transform(X[train_idx]), scaler.transform(X[val_idx])),
+            "y": (y[train_idx], y[val_idx]),
+        })
+    return folds
+
+
+def _fit_and_score(estimator, params, X_train, y_train, X_val, y_val):
+    model = clone(estimator).set_params(**params)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - start
+    return accuracy_score(y_val, model.predict(X_val)), fit_s
+
+
+def _refit(estimator, params, X_train, y_train, X_test, y_test):
+    model = clone(estimator).set_params(**params)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - start
+    return model, accuracy_score(y_test, model.predict(X_test)), fit_s
+
+
+def run_search(specs, folds, n_jobs):
+    """
+    Cross-validate every parameter combination of every model in one parallel sweep.
+
+    Returns ``{name: [{"params", "cv_mean", "cv_std", "fit_s"}, ...]}``.
+    """
+    tasks = []
+    for name, (estimator, grid, scaled) in specs.items():
+        for params in ParameterGrid(grid):
+            for fold in folds:
+                X_train, X_val = fold["scaled" if scaled else "raw"]
+                y_train, y_val = fold["y"]
+                tasks.append((name, params, (estimator, params, X_train, y_train, X_val, y_val)))
+
+    scores = Parallel(n_jobs=n_jobs)(delayed(_fit_and_score)(*args) for _, _, args in tasks)
+
+    grouped = {}
+    for (name, params, _), (score, fit_s) in zip(tasks, scores):
+        key = json.dumps(params, sort_keys=True, default=str)
+        entry = grouped.setdefault(name, {}).setdefault(key, {"params": params, "scores": [], "fit_s": 0.0})
+        entry["scores"].append(score)
+        entry["fit_s"] += fit_s
+
+    results = {}
+    for name, entries in grouped.items():
+        results[name] = [
+            {
+                "params": entry["params"],
+                "cv_mean": float(np.mean(entry["scores"])),
+                "cv_std": float(np.std(entry["scores"])),
+                "fit_s": entry["fit_s"],
+            }
+            for entry in entries.values()
+        ]
+    return results
+
+
+def train(dataset_path=DATASET_PATH, output_dir=BASE_DIR, models=None, n_jobs=-1,
+          cv=5, seed=42, write=True):
+    """
+    Run the full pipeline and return the report dict.
+    """
+    timings = {}
+    start_all = time.perf_counter()
+
+    df = load_dataset(dataset_path)
+    X = df[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    y = df["target"].to_numpy()
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=seed, stratify=y
+    )
+    scaler = StandardScaler().fit(X_train)
+    X_train_scaled, X_test_scaled = scaler.transform(X_train), scaler.transform(X_test)
+
+    specs = model_specs()
+    if models:
+        unknown = sorted(set(models) - set(specs))
+        if unknown:
+            raise ValueError(f"Unknown or unavailable models {unknown}; choose from {sorted(specs)}")
+        specs = {name: specs[name] for name in models}
+
+    start = time.perf_counter()
+    folds = build_folds(X_train, y_train, cv, seed)
+    timings["scale_folds_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    search = run_search({name: spec for name, spec in specs.items() if name != "knn"}, folds, n_jobs)
+    timings["search_s"] = time.perf_counter() - start
+
+    if "knn" in specs:
+        grid = specs["knn"][1]
+        start = time.perf_counter()
+        search["knn"] = sweep_folds(
+            [(fold["scaled"][0], fold["y"][0], fold["scaled"][1], fold["y"][1]) for fold in folds],
+            grid["n_neighbors"], grid["weights"], grid["p"],
+        )
+        timings["knn_sweep_s"] = time.perf_counter() - start
+        for entry in search["knn"]:
+            entry["fit_s"] = timings["knn_sweep_s"] / len(search["knn"])
+
+    best = {name: max(entries, key=lambda e: e["cv_mean"]) for name, entries in search.items()}
+    if "knn" in best:
+        best["knn"] = select_best(search["knn"])
+
+    start = time.perf_counter()
+    refits = Parallel(n_jobs=n_jobs)(
+        delayed(_refit)(
+            specs[name][0], best[name]["params"],
+            X_train_scaled if specs[name][2] else X_train, y_train,
+            X_test_scaled if specs[name][2] else X_test, y_test,
+        )
+        for name in best
+    )
+    timings["refit_s"] = time.perf_counter() - start
+    fitted = {name: model for name, (model, _, _) in zip(best, refits)}
+
+    report_models = {}
+    for name, (_, test_acc, refit_s) in zip(best, refits):
+        report_models[name] = {
+            "best_params": best[name]["params"],
+            "cv_accuracy": best[name]["cv_mean"],
+            "cv_std": best[name]["cv_std"],
+            "test_accuracy": test_acc,
+            "scaled_features": specs[name][2],
+            "candidates": len(search[name]),
+            "search_fit_s": sum(e["fit_s"] for e in search[name]),
+            "refit_s": refit_s,
+        }
+    best_name = max(report_models, key=lambda n: (report_models[n]["cv_accuracy"], report_models[n]["test_accuracy"]))
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "dataset": os.path.abspath(dataset_path),
+        "train_rows": int(len(X_train)),
+        "test_rows": int(len(X_test)),
+        "cv_folds": cv,
+        "n_jobs": n_jobs,
+        "best_model": {"name": best_name, "scaled_features": report_models[best_name]["scaled_features"]},
+        "models": report_models,
+        "timings": timings,
+    }
+
+    if write:
+        os.makedirs(output_dir, exist_ok=True)
+        joblib.dump(scaler, os.path.join(output_dir, "scaler.pkl"))
+        best_model = fitted[best_name]
+        if specs[best_name][2]:
+            best_model = make_pipeline(scaler, best_model)
+        joblib.dump(best_model, os.path.join(output_dir, "heart_disease_model.pkl"))
+        if "knn" in fitted:
+            joblib.dump(fitted["knn"], os.path.join(output_dir, "knn_model.pkl"))
+            export_sklearn(fitted["knn"], scaler, os.path.join(output_dir, "knn_model.mmap"),
+                           metadata={"best_params": best["knn"]["params"]})
+        report["outputs"] = sorted(f for f in os.listdir(output_dir)
+                                   if f in ("scaler.pkl", "heart_disease_model.pkl", "knn_model.pkl", "knn_model.mmap"))
+
+    timings["total_s"] = time.perf_counter() - start_all
+    if write:
+        with open(os.path.join(output_dir, "training_report.json"), "w") as f:
+            json.dump(report, f, indent=2, default=str)
+            f.write("\n")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cross-validated, parallel training of the heart-disease models.")
+    parser.add_argument("--data", default=DATASET_PATH)
+    parser.add_argument("--output-dir", default=BASE_DIR)
+    parser.add_argument("--models", nargs="+", default=None, help="subset of models to train")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="parallel workers (-1 = all cores)")
+    parser.add_argument("--cv", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dry-run", action="store_true", help="do not write any files")
+    args = parser.parse_args(argv)
+
+    report = train(args.data, args.output_dir, args.models, args.n_jobs, args.cv, args.seed,
+                   write=not args.dry_run)
+    print(f"{'model':<20} {'cv acc':>8} {'test acc':>9}  best params")
+    for name, entry in sorted(report["models"].items(), key=lambda kv: -kv[1]["cv_accuracy"]):
+        print(f"{name:<20} {entry['cv_accuracy']:>8.4f} {entry['test_accuracy']:>9.4f}  {entry['best_params']}")
+    print(f"Best model: {report['best_model']['name']}. "
+          f"Total {report['timings']['total_s']:.1f}s (search {report['timings']['search_s']:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 import streamlit as st
 import pandas as pd
-import joblib
 from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
 import os
+import shutil
+import tempfile
+
+from batch_eval import StreamingEvaluator
+from compare_models import compare_models, feature_views, knn_model, load_best_model
+from parallel_scoring import ParallelScorer
+from artifacts import ArtifactError, artifact_stamp, open_artifact, serving_index
+from metrics import METRICS, export_from_env, render_debug_panel, serve_from_env
+from schema import SchemaError, feature_matrix, iter_typed_chunks, read_csv
+from scored_output import FORMATS, ScoredFile, ScoredWriter, scored_columns
 
 st.set_page_config(
     page_title="Heart Disease Batch Tester",
@@ -15,40 +24,202 @@ st.markdown("""
 1. Load the saved KNN model and the saved StandardScaler.
 2. Predict on the entire dataset you upload.
 3. Display the overall accuracy, confusion matrix, and classification report.
+
+Very large files can be scored in **streaming mode**, which reads the CSV in
+fixed-size chunks and updates the metrics as it goes. **Comparison mode**
+scores the KNN and the saved best model (`heart_disease_model.pkl`) side by side.
+Scored rows are written to a **Parquet** or **Arrow** file as they are scored,
+ready to download.
 """)
 
+# Rows per page of the "predictions alongside uploaded data" view
+PREVIEW_PAGE_SIZE = 100
+OUTPUT_FORMATS = {"Parquet": "parquet", "Arrow IPC": "arrow"}
+
 # -------------------------------------------------------------------
 # 1) LOAD SAVED MODEL + SCALER
 # -------------------------------------------------------------------
-@st.cache_resource(show_spinner=False)
-def load_artifacts():
+BASE_DIR = os.path.dirname(__file__)
+ARTIFACT_PATH = os.path.join(BASE_DIR, "knn_model.mmap")
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_artifacts(stamp):
+    """
+    Map the exported KNN model artifact (training matrix, labels and scaler
+    parameters) from disk. ``stamp`` identifies the file on disk, so a version
+    published by update_model.py is picked up on the next rerun.
+    """
+    try:
+        with METRICS.timer("load_artifacts"):
+            return open_artifact(ARTIFACT_PATH, index=serving_index())
+    except FileNotFoundError:
+        METRICS.inc("heart_errors_total", stage="load_artifacts")
+        st.error(f"❌ Could not find 'knn_model.mmap' at {ARTIFACT_PATH}. Export it with `python artifacts.py export`.")
+    except ArtifactError as e:
+        METRICS.inc("heart_errors_total", stage="load_artifacts")
+        st.error(f"❌ Unable to load the model artifact: {e}")
+    return None
+
+try:
+    predictor = load_artifacts(artifact_stamp(ARTIFACT_PATH))
+except FileNotFoundError:
+    predictor = load_artifacts(None)
+if predictor is None:
+    st.stop()
+
+# Optional /metrics endpoint (HEART_METRICS_PORT), started once per process
+serve_from_env()
+
+
+@st.cache_resource(show_spinner=False, max_entries=1,
+                   validate=lambda scorer: not scorer.closed,
+                   on_release=lambda scorer: scorer.close())
+def load_parallel_scorer(artifact_path):
     """
-    Load the trained KNN model and the StandardScaler from disk.
+    Start one process pool (one worker per CPU) whose workers map the same
+    model artifact. Shared by every session: each call picks how many of its
+    workers to use, and the pool is only replaced, once its calls in flight
+    have finished, if the artifact path changes.
     """
-    BASE_DIR = os.path.dirname(__file__)
+    scorer = ParallelScorer(artifact_path)
+    scorer.warm_up()
+    return scorer
 
-    knn_model_path = os.path.join(BASE_DIR, "knn_model.pkl")
-    scaler_path = os.path.join(BASE_DIR, "scaler.pkl")
 
+@st.cache_resource(show_spinner=False)
+def load_comparison_model():
+    """
+    Unpickle ``heart_disease_model.pkl`` once per process. Returns
+    ``(model, None)``, or ``(None, reason)`` if it cannot be loaded.
+    """
     try:
-        knn_model = joblib.load(knn_model_path)
-    except FileNotFoundError:
-        st.error(f"❌ Could not find 'knn_model.pkl' at {knn_model_path}")
-        knn_model = None
+        return load_best_model(), None
+    except (FileNotFoundError, ImportError) as e:
+        return None, str(e)
 
+st.markdown("---")
+
+
+def show_results(acc, cm, cr, title="## 📊 Results"):
+    """
+    Render accuracy, confusion matrix and classification report.
+    """
+    st.markdown(title)
+    st.markdown(f"**Accuracy:** `{acc:.4f}`")
+
+    st.markdown("### Confusion Matrix")
+    cm_df = pd.DataFrame(
+        cm,
+        index=["Actual: No Disease (0)", "Actual: Disease (1)"],
+        columns=["Predicted: No Disease (0)", "Predicted: Disease (1)"]
+    )
+    st.table(cm_df)
+
+    st.markdown("### Classification Report")
+    st.text(cr)
+
+
+def show_schema_error(error):
+    """
+    Report a CSV that does not match the declared schema, listing every bad value.
+    """
+    METRICS.inc("heart_errors_total", stage="validate_features")
+    st.error(f"❌ The uploaded CSV does not match the expected schema: {error}")
+    if len(error.problems):
+        st.dataframe(error.problems, hide_index=True)
+
+
+@st.cache_resource(scope="session", show_spinner=False, validate=os.path.isdir,
+                   on_release=lambda path: shutil.rmtree(path, ignore_errors=True))
+def session_output_dir():
+    """
+    This session's directory for scored output, deleted when the session disconnects.
+    """
+    return tempfile.mkdtemp(prefix="heart-scored-")
+
+
+def new_output_path(fmt):
+    """
+    The session's single scored-output file: every run overwrites it, and a
+    file left in the other format is removed.
+    """
+    directory = session_output_dir()
+    path = os.path.join(directory, "scored" + FORMATS[fmt][0])
+    for name in os.listdir(directory):
+        if os.path.join(directory, name) != path:
+            os.remove(os.path.join(directory, name))
+    return path
+
+
+def write_scored_output(df, columns, fmt):
+    """
+    Write an in-memory result in one go; returns the file's path.
+    """
     try:
-        scaler = joblib.load(scaler_path)
-    except FileNotFoundError:
-        st.error(f"❌ Could not find 'scaler.pkl' at {scaler_path}")
-        scaler = None
+        with METRICS.timer("export"), ScoredWriter(new_output_path(fmt), fmt) as writer:
+            writer.write(df, columns)
+    except Exception as e:
+        METRICS.inc("heart_errors_total", stage="export")
+        st.error(f"⚠️ Unable to write the scored output: {e}")
+        st.stop()
+    return writer.path
 
-    return knn_model, scaler
 
-knn_model, scaler = load_artifacts()
-if knn_model is None or scaler is None:
-    st.stop()
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
 
-st.markdown("---")
+
+@st.fragment
+def preview_scored_output(path):
+    """
+    One page of the scored file at a time; paging reruns only this fragment.
+    """
+    scored = ScoredFile(path)
+    n_pages = max(1, -(-scored.n_rows // PREVIEW_PAGE_SIZE))
+    page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1)
+    st.dataframe(scored.page(page - 1, PREVIEW_PAGE_SIZE))
+
+
+def show_scored_output(path, fmt):
+    """
+    Download button for the scored file plus the optional paginated preview.
+    """
+    extension, mime = FORMATS[fmt]
+    # Deferred: the file is read when the button is clicked, not on every rerun.
+    st.download_button(
+        f"⬇️ Download scored rows ({os.path.getsize(path) / 2**20:,.1f} MiB)",
+        data=lambda: read_file(path), file_name=f"scored{extension}", mime=mime, on_click="ignore"
+    )
+    if st.checkbox("Show predictions alongside uploaded data"):
+        st.subheader("Uploaded Data + Predictions")
+        preview_scored_output(path)
+
+
+def show_comparison(results, wall_seconds):
+    """
+    Render one column per model plus a summary of accuracy and scoring time.
+    """
+    st.markdown("## 📊 Model Comparison")
+    st.table(pd.DataFrame(
+        [{
+            "Model": r.name,
+            "Accuracy": f"{r.evaluator.accuracy:.4f}" if r.evaluator is not None else "error",
+            "Inference time (ms)": f"{r.seconds * 1e3:,.1f}",
+        } for r in results]
+    ).set_index("Model"))
+    st.caption(f"Wall time {wall_seconds * 1e3:,.1f} ms for all models, "
+               f"vs. {sum(r.seconds for r in results) * 1e3:,.1f} ms scored one after another.")
+
+    for col, result in zip(st.columns(len(results)), results):
+        with col:
+            if result.error is not None:
+                st.markdown(f"## {result.name}")
+                st.error(f"⚠️ Error during prediction. Details:\n{result.error}")
+            else:
+                ev = result.evaluator
+                show_results(ev.accuracy, ev.confusion_matrix, ev.classification_report(), title=f"## {result.name}")
 
 # -------------------------------------------------------------------
 # 2) FILE UPLOADER
@@ -63,65 +234,167 @@ uploaded_file = st.file_uploader(
     """
 )
 
-if uploaded_file is not None:
+streaming = st.toggle(
+    "Streaming mode (for very large CSVs)",
+    help="Read, scale and score the file chunk by chunk. Peak memory depends on the chunk size, not the file size."
+)
+chunk_size = st.number_input(
+    "Rows per chunk", min_value=1_000, max_value=1_000_000, value=50_000, step=10_000,
+    disabled=not streaming
+)
+compare = st.toggle(
+    "Comparison mode (all saved models)",
+    disabled=streaming,
+    help="Parse the CSV once and score every saved model concurrently on the same rows."
+)
+n_workers = st.number_input(
+    "Worker processes", min_value=1, max_value=os.cpu_count() or 1, value=1,
+    help="Split the uploaded rows across a process pool. Workers share the memory-mapped training matrix."
+)
+
+output_format = OUTPUT_FORMATS[st.selectbox(
+    "Scored output format", list(OUTPUT_FORMATS),
+    help="Columnar file with the uploaded rows, predictions and class probabilities."
+)]
+with_distances = st.checkbox(
+    "Include neighbor distances in the scored output", disabled=compare,
+    help="Adds one column per neighbor with its distance to the scored row."
+)
+
+if n_workers > 1:
+    scorer = load_parallel_scorer(predictor.artifact_path)
+    score_rows = lambda X: scorer.predict(X, n_workers=int(n_workers))
+else:
+    score_rows = predictor.predict
+
+if uploaded_file is not None and streaming:
+    evaluator = StreamingEvaluator(labels=predictor.classes)
+    progress = st.progress(0.0, text="Scoring...")
+    live_results = st.empty()
+    writer = ScoredWriter(new_output_path(output_format), output_format)
+
     try:
-        df = pd.read_csv(uploaded_file)
+        for chunk in iter_typed_chunks(uploaded_file, int(chunk_size)):
+            try:
+                with METRICS.timer("score"):
+                    prediction = score_rows(feature_matrix(chunk))
+                with METRICS.timer("metrics"):
+                    evaluator.update(chunk["target"].to_numpy(), prediction.labels)
+            except Exception as e:
+                METRICS.inc("heart_errors_total", stage="score")
+                st.error(f"⚠️ Error while scoring rows {evaluator.n_rows + 1:,}-{evaluator.n_rows + len(chunk):,}. Make sure the CSV columns match exactly what the scaler expects. Details:\n{e}")
+                st.stop()
+
+            # Each chunk goes straight to disk, so memory stays flat however large the file.
+            try:
+                with METRICS.timer("export"):
+                    writer.write(chunk, scored_columns(prediction, predictor.classes, with_distances))
+            except Exception as e:
+                METRICS.inc("heart_errors_total", stage="export")
+                st.error(f"⚠️ Unable to write the scored output: {e}")
+                st.stop()
+
+            done = min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0)
+            progress.progress(done, text=f"Scored {evaluator.n_rows:,} rows")
+            with METRICS.timer("render"), live_results.container():
+                show_results(evaluator.accuracy, evaluator.confusion_matrix, evaluator.classification_report())
+    except SchemaError as e:
+        show_schema_error(e)
+        st.stop()
     except Exception as e:
+        METRICS.inc("heart_errors_total", stage="read_csv")
         st.error(f"⚠️ Unable to read the CSV file: {e}")
         st.stop()
+    finally:
+        writer.close()
 
-    st.write("**Preview of your uploaded data:**")
-    st.dataframe(df.head())
+    if evaluator.n_rows == 0:
+        st.error("❌ The uploaded CSV does not contain any rows.")
+        st.stop()
 
-    if "target" not in df.columns:
-        st.error("❌ The uploaded CSV does not contain a `target` column.")
+    progress.progress(1.0, text=f"Scored {evaluator.n_rows:,} rows")
+    st.success("✅ Batch evaluation complete!")
+    show_scored_output(writer.path, output_format)
+
+elif uploaded_file is not None:
+    # Parsed into compact dtypes and validated against the schema up front.
+    try:
+        with METRICS.timer("read_csv"):
+            df = read_csv(uploaded_file)
+    except SchemaError as e:
+        show_schema_error(e)
+        st.stop()
+    except Exception as e:
+        METRICS.inc("heart_errors_total", stage="read_csv")
+        st.error(f"⚠️ Unable to read the CSV file: {e}")
         st.stop()
 
+    st.write("**Preview of your uploaded data:**")
+    st.dataframe(df.head())
+
     # 3) SEPARATE FEATURES AND TARGET
     X = df.drop("target", axis=1)
     y = df["target"]
 
-    # 4) SCALE FEATURES
+    # 4) WIDEN THE COMPACT COLUMNS TO THE MATRIX THE SCALER EXPECTS
     try:
-        X_scaled = scaler.transform(X)
+        with METRICS.timer("validate_features"):
+            X_values = predictor.as_matrix(feature_matrix(X))
     except Exception as e:
+        METRICS.inc("heart_errors_total", stage="validate_features")
         st.error(f"⚠️ Error while scaling features. Make sure the CSV columns match exactly what the scaler expects. Details:\n{e}")
         st.stop()
 
-    # 5) MAKE PREDICTIONS
-    try:
-        preds = knn_model.predict(X_scaled)
-    except Exception as e:
-        st.error(f"⚠️ Error during prediction. Ensure the KNN model and features align. Details:\n{e}")
-        st.stop()
+    # 5) COMPARISON MODE: score every saved model at once on shared views
+    if compare:
+        models = [knn_model(score_rows)]
+        best_model, reason = load_comparison_model()
+        if best_model is not None:
+            models.append(best_model)
+        else:
+            st.warning(f"⚠️ Skipping `heart_disease_model.pkl`: {reason}")
 
-    # 6) CALCULATE METRICS
-    acc = accuracy_score(y, preds)
-    cm = confusion_matrix(y, preds)
-    cr = classification_report(y, preds, zero_division=0, output_dict=False)
+        with METRICS.timer("scale_features"):
+            X_raw, X_scaled = feature_views(predictor, X_values)
+        results, wall_seconds = compare_models(models, X_raw, X_scaled, y.to_numpy(), predictor.classes)
+        with METRICS.timer("render"):
+            show_comparison(results, wall_seconds)
 
-    # 7) DISPLAY RESULTS
-    st.markdown("## 📊 Results")
-    st.markdown(f"**Accuracy:** `{acc:.4f}`")
+        st.success("✅ Model comparison complete!")
+        columns = {f"predicted_target ({r.name})": r.labels for r in results if r.labels is not None}
+        show_scored_output(write_scored_output(df, columns, output_format), output_format)
 
-    st.markdown("### Confusion Matrix")
-    cm_df = pd.DataFrame(
-        cm,
-        index=["Actual: No Disease (0)", "Actual: Disease (1)"],
-        columns=["Predicted: No Disease (0)", "Predicted: Disease (1)"]
-    )
-    st.table(cm_df)
+    else:
+        # 5) MAKE PREDICTIONS (scaling is fused into the neighbor query)
+        try:
+            with METRICS.timer("score"):
+                prediction = score_rows(X_values)
+            preds = prediction.labels
+        except Exception as e:
+            METRICS.inc("heart_errors_total", stage="score")
+            st.error(f"⚠️ Error during prediction. Ensure the KNN model and features align. Details:\n{e}")
+            st.stop()
 
-    st.markdown("### Classification Report")
-    st.text(cr)
+        # 6) CALCULATE METRICS
+        with METRICS.timer("metrics"):
+            acc = accuracy_score(y, preds)
+            cm = confusion_matrix(y, preds)
+            cr = classification_report(y, preds, zero_division=0, output_dict=False)
 
-    st.success("✅ Batch evaluation complete!")
+        # 7) DISPLAY RESULTS
+        with METRICS.timer("render"):
+            show_results(acc, cm, cr)
 
-    # OPTIONAL: Show the raw predictions side by side
-    if st.checkbox("Show predictions alongside uploaded data"):
-        results_df = df.copy()
-        results_df["predicted_target"] = preds
-        st.subheader("Uploaded Data + Predictions")
-        st.dataframe(results_df)
+        st.success("✅ Batch evaluation complete!")
+
+        # 8) SCORED OUTPUT: download + paginated preview of the uploaded data with predictions
+        columns = scored_columns(prediction, predictor.classes, with_distances)
+        show_scored_output(write_scored_output(df, columns, output_format), output_format)
 else:
     st.info("ℹ️ Please upload a CSV file to get started.")
+
+# -------------------------------------------------------------------
+# DEBUG PANEL (?debug=1) + OPTIONAL METRICS FILE DUMP
+# -------------------------------------------------------------------
+render_debug_panel()
+export_from_env()
@@ -0,0 +1,209 @@
+"""
+Append newly confirmed, labeled cases to the KNN reference set without retraining.
+
+KNN has no fitted weights, so a new labeled row only has to be standardized
+and added to the reference matrix. ``append_cases``:
+
+1. scales the new rows with the artifact's *current* scaler and appends them;
+2. folds them into running per-feature statistics (count/mean/M2, merged with
+   Chan et al.'s parallel update) kept in the artifact metadata;
+3. only when those statistics drift further than ``drift_threshold`` from the
+   active scaler (mean shift or std ratio, in units of the active std) is the
+   whole reference set rescaled to the new mean/std;
+4. publishes the result atomically as the next ``model_version``.
+
+Running Streamlit apps key their cached predictor on ``artifact_stamp`` and
+pick up the new version on their next rerun, without a restart.
+
+Cost: every call rewrites the whole artifact, O(N) in the reference rows
+(about 13 x 8 bytes plus label and bias per row, ~120 MB at 1M rows), however
+few rows it appends. That is what keeps publishing atomic: the new version is
+written to a temporary file and renamed over the old one, so processes still
+mapping the previous version keep a consistent file. Batch new cases into
+one call rather than appending them one at a time.
+
+CLI::
+
+    python update_model.py new_cases.csv --drift-threshold 0.05
+"""
+import argparse
+import contextlib
+import os
+
+import numpy as np
+
+from artifacts import ARTIFACT_PATH, open_artifact, write_artifact
+from predictor import KNNPredictor
+
+DEFAULT_DRIFT_THRESHOLD = 0.05
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, appenders must not overlap
+    fcntl = None
+
+
+@contextlib.contextmanager
+def _update_lock(artifact_path):
+    """
+    Serialize concurrent appenders (read-modify-publish) on one artifact.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(artifact_path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _stats_of(rows):
+    rows = np.asarray(rows, dtype=np.float64)
+    mean = rows.mean(axis=0)
+    return {"count": rows.shape[0], "mean": mean, "m2": ((rows - mean) ** 2).sum(axis=0)}
+
+
+def merge_stats(a, b):
+    """
+    Combine two ``{"count", "mean", "m2"}`` summaries (Chan et al.).
+    """
+    count = a["count"] + b["count"]
+    if count == 0:
+        return a
+    delta = b["mean"] - a["mean"]
+    mean = a["mean"] + delta * (b["count"] / count)
+    m2 = a["m2"] + b["m2"] + delta ** 2 * (a["count"] * b["count"] / count)
+    return {"count": count, "mean": mean, "m2": m2}
+
+
+def running_stats(predictor):
+    """
+    Running raw-feature statistics of the reference set behind ``predictor``.
+
+    Read from the artifact metadata when present, otherwise computed once from
+    the (unscaled) reference rows.
+    """
+    stored = ((predictor.artifact or {}).get("metadata") or {}).get("running_stats")
+    if stored:
+        return {
+            "count": int(stored["count"]),
+            "mean": np.asarray(stored["mean"], dtype=np.float64),
+            "m2": np.asarray(stored["m2"], dtype=np.float64),
+        }
+    return _stats_of(predictor.train_scaled * predictor.scale + predictor.mean)
+
+
+def scaler_params(stats):
+    """
+    ``(mean, scale)`` a ``StandardScaler`` would fit on rows with these stats.
+    """
+    std = np.sqrt(stats["m2"] / stats["count"])
+    # StandardScaler leaves constant features unscaled.
+    return stats["mean"], np.where(std > 0.0, std, 1.0)
+
+
+def scaler_drift(mean, scale, new_mean, new_scale):
+    """
+    Largest mean shift or std ratio change between two scalers, in units of ``scale``.
+    """
+    return float(max(
+        np.max(np.abs(new_mean - mean) / scale),
+        np.max(np.abs(new_scale / scale - 1.0)),
+    ))
+
+
+def append_cases(rows, labels, artifact_path=ARTIFACT_PATH,
+                 drift_threshold=DEFAULT_DRIFT_THRESHOLD, force_rescale=False):
+    """
+    Append labeled raw rows to the artifact and publish the next version.
+
+    Returns a summary dict (new version, row counts, drift, whether the
+    reference set was rescaled). The whole artifact is rewritten on every call
+    (O(reference rows), see the module docstring), so pass cases in batches.
+    """
+    with _update_lock(artifact_path):
+        current = open_artifact(artifact_path)
+        rows = current.as_matrix(rows)
+        labels = np.asarray(labels)
+        if rows.shape[0] == 0:
+            raise ValueError("No cases to append")
+        if labels.shape != (rows.shape[0],):
+            raise ValueError(f"Got {rows.shape[0]} rows but {labels.size} labels")
+        if not np.all(np.isfinite(rows)):
+            raise ValueError("New cases contain missing or non-finite values")
+        unknown = np.setdiff1d(labels, current.classes)
+        if unknown.size:
+            raise ValueError(f"Unknown labels {unknown.tolist()}; expected {current.classes.tolist()}")
+
+        stats = merge_stats(running_stats(current), _stats_of(rows))
+        new_mean, new_scale = scaler_params(stats)
+        drift = scaler_drift(current.mean, current.scale, new_mean, new_scale)
+        rescale = force_rescale or drift > drift_threshold
+
+        if rescale:
+            raw = np.vstack([current.train_scaled * current.scale + current.mean, rows])
+            mean, scale = new_mean, new_scale
+            train_scaled = (raw - mean) / scale
+            bias = None
+        else:
+            mean, scale = current.mean, current.scale
+            added = (rows - mean) / scale
+            train_scaled = np.vstack([current.train_scaled, added])
+            bias = None
+            if current._bias is not None:
+                bias = np.concatenate([current._bias, KNNPredictor.fold_bias(added, mean, scale)])
+
+        train_y = np.concatenate([current.train_y, np.searchsorted(current.classes, labels)])
+        updated = KNNPredictor(
+            train_scaled, train_y, current.classes, mean, scale,
+            n_neighbors=current.n_neighbors, weights=current.weights, p=current.p,
+            feature_names=current.feature_names, bias=bias,
+        )
+
+        metadata = dict(current.artifact.get("metadata") or {})
+        metadata["running_stats"] = {
+            "count": int(stats["count"]),
+            "mean": stats["mean"].tolist(),
+            "m2": stats["m2"].tolist(),
+        }
+        metadata["last_update"] = {"appended": int(rows.shape[0]), "drift": drift, "rescaled": bool(rescale)}
+        version = current.artifact["model_version"] + 1
+        write_artifact(artifact_path, updated, model_version=version, metadata=metadata)
+
+    return {
+        "model_version": version,
+        "appended": int(rows.shape[0]),
+        "reference_rows": int(train_scaled.shape[0]),
+        "drift": drift,
+        "rescaled": bool(rescale),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Append labeled cases to the KNN model artifact.",
+        epilog="Each run rewrites the whole artifact (O(reference rows)); append cases in batches.",
+    )
+    parser.add_argument("csv", help="CSV with the 13 feature columns plus `target`")
+    parser.add_argument("--artifact", default=ARTIFACT_PATH)
+    parser.add_argument("--drift-threshold", type=float, default=DEFAULT_DRIFT_THRESHOLD,
+                        help="rescale the whole reference set once the scaler drifts this far")
+    parser.add_argument("--rescale", action="store_true", help="always rescale to the running statistics")
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+
+    df = pd.read_csv(args.csv)
+    if "target" not in df.columns:
+        parser.error(f"{args.csv} has no `target` column")
+    summary = append_cases(df.drop("target", axis=1), df["target"].to_numpy(), args.artifact,
+                           drift_threshold=args.drift_threshold, force_rescale=args.rescale)
+    print(f"Published model version {summary['model_version']} to {os.path.abspath(args.artifact)}: "
+          f"+{summary['appended']} rows ({summary['reference_rows']} total), "
+          f"drift {summary['drift']:.4f}, {'rescaled' if summary['rescaled'] else 'not rescaled'}")
+
+
+if __name__ == "__main__":
+    main()